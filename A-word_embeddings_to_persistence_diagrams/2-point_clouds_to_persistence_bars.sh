@@ -6,8 +6,11 @@ PATH_BARS="./data/bars"
 
 MAXDIM=2  # Maximal degree of persistent homology to be computed. Every additional degree significantly increases complexity.
 NUMBER_OF_WORDS=10000  # Only the first NUMBER_OF_WORDS tokens will be used from each point cloud.
+NUMBER_OF_LANDMARKS=""  # If set, the bars are computed only for this many landmarks (greedy farthest-point sampling) of the NUMBER_OF_WORDS tokens
 
-REMOVE_MATRICES=true  # If true, the token-to-token distance matrices are removed after the bars are computed
+BACKEND="ripser-cli"  # "ripser-cli" runs ./ripser/ripser on the distance matrix, "in-process" uses point_cloud_to_bars.py (Python ripser bindings, no distance matrix on disk)
+CACHE_MATRICES=false  # If true, the distance matrix of the whole point cloud is cached once per language and metric; runs with any NUMBER_OF_WORDS then read its leading block
+REMOVE_MATRICES=true  # If true, the token-to-token distance matrices are not kept on disk, they are piped straight into ripser
 
 echo "Generate barcodes start: $(date)"
 TIME_START=`date +%s`  # to measure the time the script takes
@@ -17,18 +20,42 @@ for METRIC in "euclidean" "cosine"; do  # token-to-token distance notion to use
         TIME_START_LANG=`date +%s`
         echo "Processing language ${LANG}, the first ${NUMBER_OF_WORDS} words, metric ${METRIC}, maxdim ${MAXDIM}."
         NAME="${LANG}.300.n${NUMBER_OF_WORDS}.${METRIC}"
-        FILENAME_DMAT="${PATH_DISTANCE_MATRICES}/dmat.${NAME}.txt"
+        FILENAME_DMAT="${PATH_DISTANCE_MATRICES}/dmat.${NAME}.bin"
+        CACHE_ARGS=()
+        LANDMARK_ARGS=()
+        if ${CACHE_MATRICES}
+        then
+            CACHE_ARGS=(--cache "${PATH_DISTANCE_MATRICES}/dmat-cache.${LANG}.300.cut10k.${METRIC}.npy")
+        fi
         FILENAME_BARS="${PATH_BARS}/bars.${NAME}.d${MAXDIM}.txt"
-        head -n $NUMBER_OF_WORDS "${PATH_POINT_CLOUDS}/point-cloud.${LANG}.300.cut10k.vec" \
-            | python3 compute_point-cloud_distance_matrix.py --metric $METRIC \
-            > "${FILENAME_DMAT}"
-        echo "    Distance matrix generated. Computing bars."
-        ./ripser/ripser --format lower-distance --dim $MAXDIM "${PATH_DISTANCE_MATRICES}/dmat.${NAME}.txt" \
-            | python3 ripser_output_to_bars.py \
-            > "${FILENAME_BARS}"
-        if ${REMOVE_MATRICES}
+        if [[ -n "${NUMBER_OF_LANDMARKS}" ]]
+        then
+            # the bars of the landmarks are approximate, they must not take the name of the bars of all points
+            FILENAME_BARS="${PATH_BARS}/bars.${NAME}.l${NUMBER_OF_LANDMARKS}.d${MAXDIM}.txt"
+            # the landmark indices and the covering radius (error bound) are saved next to the bars
+            LANDMARK_ARGS=(--landmarks $NUMBER_OF_LANDMARKS --landmarks_output "${PATH_BARS}/landmarks.${NAME}.l${NUMBER_OF_LANDMARKS}.txt")
+        fi
+        if [[ "${BACKEND}" == "in-process" ]]
+        then
+            python3 point_cloud_to_bars.py --metric $METRIC --dim $MAXDIM \
+                --input "${PATH_POINT_CLOUDS}/point-cloud.${LANG}.300.cut10k.npy" --number $NUMBER_OF_WORDS \
+                "${LANDMARK_ARGS[@]}" --output "${FILENAME_BARS}"
+        elif ${REMOVE_MATRICES}
         then
-            rm "${FILENAME_DMAT}"
+            # binary float32 lower-triangular matrix streamed through a pipe, never written to disk
+            python3 compute_point-cloud_distance_matrix.py --metric $METRIC --output_format binary \
+                --input "${PATH_POINT_CLOUDS}/point-cloud.${LANG}.300.cut10k.npy" --input_type np --number $NUMBER_OF_WORDS "${CACHE_ARGS[@]}" "${LANDMARK_ARGS[@]}" \
+                | ./ripser/ripser --format binary --dim $MAXDIM \
+                | python3 ripser_output_to_bars.py \
+                > "${FILENAME_BARS}"
+        else
+            python3 compute_point-cloud_distance_matrix.py --metric $METRIC --output_format binary \
+                --input "${PATH_POINT_CLOUDS}/point-cloud.${LANG}.300.cut10k.npy" --input_type np --number $NUMBER_OF_WORDS "${CACHE_ARGS[@]}" "${LANDMARK_ARGS[@]}" \
+                > "${FILENAME_DMAT}"
+            echo "    Distance matrix generated. Computing bars."
+            ./ripser/ripser --format binary --dim $MAXDIM "${FILENAME_DMAT}" \
+                | python3 ripser_output_to_bars.py \
+                > "${FILENAME_BARS}"
         fi
         TIME_END_LANG=`date +%s`
         RUNTIME_LANG=$((TIME_END_LANG-TIME_START_LANG))
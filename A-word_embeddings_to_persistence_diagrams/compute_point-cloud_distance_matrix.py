@@ -1,21 +1,50 @@
 import numpy as np
 import argparse
+import os
 import sys
 
+from point_cloud_store import PointCloudStore
+from point_cloud_distances import (lower_triangular_blocks, lower_triangular_distances, lower_triangular_size,
+                                   build_distance_cache, distance_cache_dtype, load_distance_cache,
+                                   select_landmarks)
+
 
 def init_args():
     parser = argparse.ArgumentParser(
         prog='From point-cloud to distance matrix',
         description='''Loads a point cloud from space-separated-value file/stdin, one point per row.
 Outputs space-separated-value lower-triangular distance matrix, i.e.,
-list of the distance matrix entries below the diagonal, sorted lexicographically by row index, then column index.''')
+list of the distance matrix entries below the diagonal, sorted lexicographically by row index, then column index.
+With --output_format binary, the same entries are written as little-endian float32 values,
+which is the binary input format of ripser (--format binary).''')
     parser.add_argument('--input', '-i', type=str, required=False, default=None,
                         help='Path to the point-cloud file. By default standard input used.')
-    parser.add_argument('--input_type', type=str, required=False, default='txt', choices=['txt', 'np'],
-                        help='Type of the file. Either text file (txt) or numpy file (np) (default txt)')
+    parser.add_argument('--input_type', type=str, required=False, default='txt', choices=['txt', 'np', 'store'],
+                        help='Type of the file. Either text file (txt), numpy file (np) or point-cloud store folder '
+                             '(store, see point_cloud_store.py) (default txt)')
+    parser.add_argument('--language', type=str, required=False, default=None,
+                        help='Language to load from the point-cloud store (only with --input_type store).')
+    parser.add_argument('--number', '-n', type=int, required=False, default=None,
+                        help='Use only the first NUMBER points of the point cloud. By default all points used.')
     parser.add_argument('--output', '-o', type=str, required=False, default=None,
                         help='Path to the output. By default standard output used.')
+    parser.add_argument('--output_format', type=str, required=False, default='txt', choices=['txt', 'binary'],
+                        help='Either text (txt) or ripser binary lower-triangular float32 (binary) (default txt)')
     parser.add_argument('--metric', type=str, required=True, choices=['euclidean', 'cosine'])
+    parser.add_argument('--landmarks', type=int, required=False, default=None,
+                        help='''If given, only the distance matrix of this many landmarks is output.
+The landmarks are selected from the (first NUMBER) points by greedy farthest-point sampling.
+The covering radius (Hausdorff distance between the landmarks and the point cloud) is reported on standard error.''')
+    parser.add_argument('--landmarks_output', type=str, required=False, default=None,
+                        help='Path to save the indices of the landmarks and the covering radius (text file).')
+    parser.add_argument('--cache', type=str, required=False, default=None,
+                        help='''Path to a distance cache (.npy) of the whole point cloud for this metric.
+If it does not exist (or is older than the input, or was computed in the other precision), it is computed first.
+The distance matrix of the first NUMBER points is then served from the cache.''')
+    parser.add_argument('--block_size', type=int, required=False, default=1024,
+                        help='Number of matrix rows computed at once; bounds the peak memory (default 1024)')
+    parser.add_argument('--float32', action='store_const', const=True, default=False,
+                        help='Compute the distances in single precision (default: double precision)')
 
     return parser.parse_args()
 
@@ -24,8 +53,12 @@ def load_vectors_text(file_name):
     return np.loadtxt(file_name if file_name else sys.stdin, delimiter=' ')
 
 
-def load_vectors_numpy(file_name):
-    return np.load(file_name)
+def load_vectors_numpy(file_name, mmap_mode='r'):
+    return np.load(file_name, mmap_mode=mmap_mode)
+
+
+def load_vectors_store(store_folder, language, n=None):
+    return PointCloudStore(store_folder).load(language, n)
 
 
 def euclidean_distance(a, b):
@@ -37,16 +70,38 @@ def cosine_distance(a, b):
 
 
 def compute_and_save_matrix(write_method, pts, metric_name='euclidean',
-                            column_separator=' ', row_separator='\n', decimal_places=10):
-    distance = {
-        'euclidean': euclidean_distance,
-        'cosine': cosine_distance
-    }[metric_name]
-    for i in range(1, len(pts)):
-        for j in range(i):
-            write_method(f'{distance(pts[i], pts[j]):.{decimal_places}f}')
-            write_method(column_separator)
-        write_method(row_separator)
+                            column_separator=' ', row_separator='\n', decimal_places=10,
+                            block_size=1024, dtype='float64'):
+    row_format = f'%.{decimal_places}f{column_separator}'
+    for start, stop, block in lower_triangular_blocks(pts, metric_name=metric_name, block_size=block_size,
+                                                      dtype=dtype):
+        rows = [(row_format * i) % tuple(block[i - start, :i].tolist()) + row_separator
+                for i in range(max(start, 1), stop)]
+        write_method(''.join(rows))
+
+
+def compute_and_save_matrix_binary(write_method, pts, metric_name='euclidean', block_size=1024, dtype='float64'):
+    for distances in lower_triangular_distances(pts, metric_name=metric_name, block_size=block_size, dtype=dtype):
+        write_method(distances.astype('<f4').tobytes())
+
+
+def save_cached_matrix(write_method, distances, n, column_separator=' ', row_separator='\n', decimal_places=10,
+                       block_size=1024):
+    row_format = f'%.{decimal_places}f{column_separator}'
+    for start in range(1, n, block_size):
+        stop = min(start + block_size, n)
+        offset = lower_triangular_size(start)
+        block = distances[offset:lower_triangular_size(stop)].tolist()
+        rows = []
+        for i in range(start, stop):
+            row = block[lower_triangular_size(i) - offset:lower_triangular_size(i + 1) - offset]
+            rows.append((row_format * i) % tuple(row) + row_separator)
+        write_method(''.join(rows))
+
+
+def save_cached_matrix_binary(write_method, distances, block_size=1024 ** 2):
+    for start in range(0, len(distances), block_size):
+        write_method(distances[start:start + block_size].astype('<f4').tobytes())
 
 
 def main():
@@ -55,11 +110,40 @@ def main():
         pts = load_vectors_text(args.input)
     elif args.input_type == 'np':
         pts = load_vectors_numpy(args.input)
+    elif args.input_type == 'store':
+        pts = load_vectors_store(args.input, args.language)
+    dtype = 'float32' if args.float32 else 'float64'
+    if args.cache and args.landmarks:
+        raise ValueError('The options --cache and --landmarks cannot be combined.')
+    if args.cache:
+        if (not os.path.exists(args.cache) or distance_cache_dtype(args.cache) != np.dtype(dtype)
+                or (args.input and os.path.getmtime(args.cache) < os.path.getmtime(args.input))):
+            build_distance_cache(args.cache, pts, metric_name=args.metric, block_size=args.block_size, dtype=dtype)
+        n = len(pts) if args.number is None else min(args.number, len(pts))
+        distances = load_distance_cache(args.cache, n, dtype=dtype)
+        if args.output_format == 'binary':
+            save_method, mode = (lambda write_method: save_cached_matrix_binary(write_method, distances)), 'wb'
+        else:
+            save_method, mode = (lambda write_method: save_cached_matrix(write_method, distances, n)), 'w'
+    else:
+        if args.number is not None:
+            pts = pts[:args.number]
+        if args.landmarks:
+            pts = select_landmarks(pts, args.landmarks, args.metric, args.landmarks_output)
+        if args.output_format == 'binary':
+            save_method, mode = (lambda write_method: compute_and_save_matrix_binary(
+                write_method, pts, metric_name=args.metric, block_size=args.block_size, dtype=dtype)), 'wb'
+        else:
+            save_method, mode = (lambda write_method: compute_and_save_matrix(
+                write_method, pts, metric_name=args.metric, block_size=args.block_size, dtype=dtype)), 'w'
     if args.output:
-        with open(args.output, 'w') as file:
-            compute_and_save_matrix(lambda text: file.write(text), pts, metric_name=args.metric)
+        with open(args.output, mode) as file:
+            save_method(file.write)
+    elif mode == 'wb':
+        save_method(sys.stdout.buffer.write)
+        sys.stdout.buffer.flush()
     else:
-        compute_and_save_matrix(lambda text: print(text, end=''), pts, metric_name=args.metric)
+        save_method(lambda text: print(text, end=''))
 
 
 if __name__ == '__main__':
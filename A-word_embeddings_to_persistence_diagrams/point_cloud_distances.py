@@ -0,0 +1,146 @@
+import os
+import sys
+
+import numpy as np
+
+
+def squared_norms(pts):
+    return np.einsum('ij,ij->i', pts, pts)
+
+
+def lower_triangular_blocks(pts, metric_name='euclidean', block_size=1024, dtype='float64'):
+    """Iterate over the distance matrix of the point cloud in blocks of rows.
+
+    Yields triples (start, stop, block), where block[k, j] is the distance between pts[start + k] and pts[j]
+    for j < stop. Only the entries below the diagonal (j < start + k) are meaningful for the lower-triangular
+    matrix, the rest of the block is computed as a by-product. The peak memory is about block_size * len(pts)
+    values of the given dtype.
+    """
+    pts = np.asarray(pts, dtype=dtype)
+    if metric_name == 'euclidean':
+        norms = squared_norms(pts)
+    elif metric_name == 'cosine':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pts = pts / np.linalg.norm(pts, axis=1)[:, np.newaxis]
+    else:
+        raise ValueError(f'Unknown metric {metric_name}')
+    for start in range(0, len(pts), block_size):
+        stop = min(start + block_size, len(pts))
+        block = pts[start:stop] @ pts[:stop].T
+        if metric_name == 'euclidean':
+            block *= -2
+            block += norms[start:stop, np.newaxis]
+            block += norms[np.newaxis, :stop]
+            np.maximum(block, 0, out=block)
+            np.sqrt(block, out=block)
+        else:
+            np.subtract(1, block, out=block)
+        yield start, stop, block
+
+
+def lower_triangular_mask(start, stop):
+    """Boolean mask selecting the entries below the diagonal of a block returned by lower_triangular_blocks."""
+    return np.arange(stop)[np.newaxis, :] < np.arange(start, stop)[:, np.newaxis]
+
+
+def lower_triangular_distances(pts, metric_name='euclidean', block_size=1024, dtype='float64'):
+    """Iterate over the entries below the diagonal, sorted by row, then column, one 1D array per block of rows."""
+    for start, stop, block in lower_triangular_blocks(pts, metric_name=metric_name, block_size=block_size,
+                                                      dtype=dtype):
+        yield block[lower_triangular_mask(start, stop)]
+
+
+def distance_matrix(pts, metric_name='euclidean', block_size=1024, dtype='float64'):
+    """Return the full (symmetric, zero diagonal) distance matrix of the point cloud."""
+    matrix = np.zeros((len(pts), len(pts)), dtype=dtype)
+    for start, stop, block in lower_triangular_blocks(pts, metric_name=metric_name, block_size=block_size,
+                                                      dtype=dtype):
+        mask = lower_triangular_mask(start, stop)
+        matrix[start:stop, :stop][mask] = block[mask]
+        matrix[:stop, start:stop][mask.T] = block.T[mask.T]
+    return matrix
+
+
+def lower_triangular_size(n):
+    return n * (n - 1) // 2
+
+
+def build_distance_cache(file_name, pts, metric_name='euclidean', block_size=1024, dtype='float64'):
+    """Save the entries below the diagonal of the distance matrix of the point cloud to a numpy (.npy) file.
+
+    The entries are sorted by row, so the distance matrix of the first n points consists of
+    the first n(n-1)/2 entries of the file, see load_distance_cache.
+    """
+    temporary_file_name = f'{file_name}.tmp'
+    cache = np.lib.format.open_memmap(temporary_file_name, mode='w+', dtype=dtype,
+                                      shape=(lower_triangular_size(len(pts)),))
+    position = 0
+    for distances in lower_triangular_distances(pts, metric_name=metric_name, block_size=block_size, dtype=dtype):
+        cache[position:position + len(distances)] = distances
+        position += len(distances)
+    cache.flush()
+    del cache
+    os.replace(temporary_file_name, file_name)
+
+
+def distance_cache_dtype(file_name):
+    """The dtype the cache was computed in, from the header of the .npy file."""
+    return np.load(file_name, mmap_mode='r').dtype
+
+
+def load_distance_cache(file_name, n, dtype=None):
+    """Memory-map the entries below the diagonal of the distance matrix of the first n points from the cache.
+    If dtype is given, the cache must have been computed in this dtype."""
+    cache = np.load(file_name, mmap_mode='r')
+    if lower_triangular_size(n) > len(cache):
+        raise ValueError(f'The distance cache {file_name} holds fewer than {n} points.')
+    if dtype is not None and cache.dtype != np.dtype(dtype):
+        raise ValueError(f'The distance cache {file_name} holds {cache.dtype} distances, not {np.dtype(dtype)}.')
+    return cache[:lower_triangular_size(n)]
+
+
+def greedy_permutation(pts, number_of_landmarks, metric_name='euclidean', first_index=0, dtype='float64'):
+    """Select landmarks from the point cloud by greedy farthest-point sampling.
+
+    Return the indices of the landmarks (in the order of selection) and the covering radius, i.e., the largest distance
+    from a point to its nearest landmark. The covering radius is the Hausdorff distance between the landmarks and the
+    point cloud; for a metric (euclidean, but not cosine), the bottleneck distance between the Rips persistence diagrams of the
+    landmarks and of the whole point cloud is at most twice the covering radius.
+    """
+    pts = np.asarray(pts, dtype=dtype)
+    if metric_name == 'euclidean':
+        norms = squared_norms(pts)
+
+        def distances_to(index):
+            return np.sqrt(np.maximum(norms + norms[index] - 2 * (pts @ pts[index]), 0))
+    elif metric_name == 'cosine':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pts = pts / np.linalg.norm(pts, axis=1)[:, np.newaxis]
+
+        def distances_to(index):
+            return 1 - pts @ pts[index]
+    else:
+        raise ValueError(f'Unknown metric {metric_name}')
+    number_of_landmarks = min(number_of_landmarks, len(pts))
+    landmarks = np.empty(number_of_landmarks, dtype='int64')
+    landmarks[0] = first_index
+    nearest_landmark_distance = distances_to(first_index)
+    for k in range(1, number_of_landmarks):
+        landmarks[k] = np.argmax(nearest_landmark_distance)
+        np.minimum(nearest_landmark_distance, distances_to(landmarks[k]), out=nearest_landmark_distance)
+    nearest_landmark_distance[landmarks] = 0
+    return landmarks, float(nearest_landmark_distance.max())
+
+
+def select_landmarks(pts, number_of_landmarks, metric_name, landmarks_output=None):
+    landmarks, covering_radius = greedy_permutation(pts, number_of_landmarks, metric_name=metric_name)
+    if metric_name == 'euclidean':
+        bound = f'bottleneck distance to the diagrams of all points at most {2 * covering_radius:.10f}'
+    else:
+        bound = f'no bound on the bottleneck distance, {metric_name} distance is not a metric'
+    print(f'[INFO] {len(landmarks)} landmarks out of {len(pts)} points, covering radius {covering_radius:.10f} '
+          f'({bound})', file=sys.stderr)
+    if landmarks_output:
+        np.savetxt(landmarks_output, landmarks, fmt='%d',
+                   header=f'{metric_name} covering radius: {covering_radius:.10f}')
+    return pts[np.sort(landmarks)]
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Point-cloud store',
+        description='''Adds point clouds (point-cloud.<language>.300.cut10k.npy) to a single float32 store,
+which can be memory-mapped to get the first n points of any language without copying.
+Languages already in the store are skipped, so the store can be built incrementally.''')
+    parser.add_argument('store', type=str,
+                        help='Folder of the store (created if it does not exist)')
+    parser.add_argument('--languages', '-l', type=str, nargs='*', required=False, default=(),
+                        help='List of the languages to add.')
+    parser.add_argument('--point_clouds_folder', type=str, required=False, default='data/point-clouds',
+                        help='Folder with the numpy point clouds (default data/point-clouds)')
+
+    return parser.parse_args()
+
+
+class PointCloudStore:
+    """Point clouds of all languages in one raw float32 file (one point per row, languages one after another)
+    with a JSON index language -> (offset, rows), where the offset is the index of the first row of the language."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.data_filename = self.folder / 'point-clouds.f32'
+        self.index_filename = self.folder / 'point-clouds.index.json'
+        if self.index_filename.exists():
+            with open(self.index_filename, 'r') as file:
+                self.index = json.load(file)
+        else:
+            self.index = {'dtype': 'float32', 'dimension': None, 'rows': 0, 'languages': {}}
+
+    @property
+    def languages(self):
+        return list(self.index['languages'])
+
+    def __contains__(self, language):
+        return language in self.index['languages']
+
+    def add(self, language, pts, replace=False):
+        """Add the point cloud of the language. With replace, a language already in the store gets the new points,
+        appended after the last row (the index then points to them), otherwise it is an error."""
+        if language in self and not replace:
+            raise ValueError(f'Language {language} is already in the store {self.folder}.')
+        pts = np.ascontiguousarray(pts, dtype=self.index['dtype'])
+        if self.index['dimension'] is None:
+            self.index['dimension'] = pts.shape[1]
+        elif pts.shape[1] != self.index['dimension']:
+            raise ValueError(f"The point cloud has dimension {pts.shape[1]}, the store {self.index['dimension']}.")
+        self.folder.mkdir(parents=True, exist_ok=True)
+        offset = self.index['rows']
+        with open(self.data_filename, 'r+b' if self.data_filename.exists() else 'wb') as file:
+            # write after the last indexed row, overwriting whatever an interrupted add may have left behind
+            file.seek(offset * pts.shape[1] * pts.itemsize)
+            file.write(pts.tobytes())
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+        self.index['languages'][language] = {'offset': offset, 'rows': len(pts)}
+        self.index['rows'] = offset + len(pts)
+        self._save_index()
+
+    def load(self, language, n=None):
+        """Return a read-only memory-mapped view of the first n points (all points if n is None) of the language."""
+        entry = self.index['languages'][language]
+        rows = entry['rows'] if n is None else min(n, entry['rows'])
+        dimension = self.index['dimension']
+        return np.memmap(self.data_filename, dtype=self.index['dtype'], mode='r',
+                         offset=entry['offset'] * dimension * np.dtype(self.index['dtype']).itemsize,
+                         shape=(rows, dimension))
+
+    def _save_index(self):
+        temporary_filename = f'{self.index_filename}.tmp'
+        with open(temporary_filename, 'w') as file:
+            json.dump(self.index, file)
+        os.replace(temporary_filename, self.index_filename)
+
+
+def main():
+    args = init_args()
+    store = PointCloudStore(args.store)
+    for language in args.languages:
+        if language in store:
+            print(f'[INFO] {language} already in the store, skipping.')
+            continue
+        store.add(language, np.load(Path(args.point_clouds_folder) / f'point-cloud.{language}.300.cut10k.npy'))
+        print(f'[INFO] Added {language} to the store.')
+    print(f"[INFO] The store {args.store} contains {len(store.languages)} languages, {store.index['rows']} points.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import argparse
+
+import numpy as np
+
+from point_cloud_distances import distance_matrix, select_landmarks
+from point_cloud_store import PointCloudStore
+from ripser_output_to_bars import save_bars_text, save_bars_binary
+
+
+# above this many points, the gudhi backend needs --threshold: the 1-skeleton of the full Rips complex has n(n-1)/2 edges
+GUDHI_MAX_POINTS = 2000
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='From point-cloud to bars',
+        description='''Computes persistent homology of a point cloud in-process, without writing the distance matrix
+to disk and without parsing the ripser text output. The bars are saved in the same formats as ripser_output_to_bars.py.''')
+    parser.add_argument('--input', '-i', type=str, required=True,
+                        help='Path to the point-cloud numpy (.npy) file, or the point-cloud store folder with --language.')
+    parser.add_argument('--language', type=str, required=False, default=None,
+                        help='If given, the point cloud of this language is loaded from the point-cloud store.')
+    parser.add_argument('--output', '-o', type=str, required=True,
+                        help='Path to the output bars file.')
+    parser.add_argument('--output_format', type=str, required=False, default='txt', choices=['txt', 'binary'],
+                        help='Either text bars (txt) or binary .npz container (binary) (default txt)')
+    parser.add_argument('--metric', type=str, required=True, choices=['euclidean', 'cosine'])
+    parser.add_argument('--number', '-n', type=int, required=False, default=None,
+                        help='Use only the first NUMBER points of the point cloud. By default all points used.')
+    parser.add_argument('--landmarks', type=int, required=False, default=None,
+                        help='If given, compute the bars of this many landmarks selected by greedy farthest-point sampling.')
+    parser.add_argument('--landmarks_output', type=str, required=False, default=None,
+                        help='Path to save the indices of the landmarks and the covering radius (text file).')
+    parser.add_argument('--dim', type=int, required=False, default=1,
+                        help='Maximal dimension of persistent homology to compute (default 1)')
+    parser.add_argument('--backend', type=str, required=False, default='ripser', choices=['ripser', 'gudhi'],
+                        help='Python library to compute persistent homology with (default ripser)')
+    parser.add_argument('--threshold', type=float, required=False, default=None,
+                        help='If given, only edges up to this length enter the Rips complex; bars dying later become '
+                             'infinite (default: no threshold, required by the gudhi backend above '
+                             f'{GUDHI_MAX_POINTS} points)')
+    parser.add_argument('--keep_infinite', action='store_const', const=True, default=False,
+                        help='Keep the infinite bars (default: do not keep the infinite bars)')
+
+    return parser.parse_args()
+
+
+def compute_diagrams_ripser(dmat, maxdim, threshold=None):
+    import ripser
+    return ripser.ripser(dmat, maxdim=maxdim, distance_matrix=True,
+                         thresh=np.inf if threshold is None else threshold)['dgms']
+
+
+def compute_diagrams_gudhi(dmat, maxdim, threshold=None):
+    """Only the 1-skeleton of the Rips complex is built; its edges are collapsed (which keeps the persistent homology)
+    before it is expanded to the simplices of dimension maxdim + 1."""
+    import gudhi
+    if threshold is None and len(dmat) > GUDHI_MAX_POINTS:
+        raise ValueError(f'The gudhi backend needs a threshold for more than {GUDHI_MAX_POINTS} points '
+                         f'(got {len(dmat)}), or use the ripser backend')
+    rips_complex = gudhi.RipsComplex(distance_matrix=dmat, max_edge_length=np.inf if threshold is None else threshold)
+    simplex_tree = rips_complex.create_simplex_tree(max_dimension=1)
+    if maxdim > 0:
+        simplex_tree.collapse_edges(nb_iterations=maxdim + 1)
+        simplex_tree.expansion(maxdim + 1)
+    simplex_tree.compute_persistence()
+    return [simplex_tree.persistence_intervals_in_dimension(dim) for dim in range(maxdim + 1)]
+
+
+def compute_bars(pts, metric_name='euclidean', maxdim=1, backend='ripser', keep_infinite=False, threshold=None):
+    """Return the list of bars for dimensions 0, ..., maxdim, each a float64 array of shape (#bars, 2)
+    with columns birth, death. The distance matrix is kept in memory in single precision, as in ripser."""
+    dmat = distance_matrix(pts, metric_name=metric_name, dtype='float32')
+    diagrams = {
+        'ripser': compute_diagrams_ripser,
+        'gudhi': compute_diagrams_gudhi
+    }[backend](dmat, maxdim, threshold)
+    bars = []
+    for diagram in diagrams:
+        diagram = np.asarray(diagram, dtype='float64').reshape(-1, 2)
+        if not keep_infinite:
+            diagram = diagram[np.isfinite(diagram[:, 1])]
+        bars.append(diagram)
+    return bars
+
+
+def main():
+    args = init_args()
+    if args.language:
+        pts = PointCloudStore(args.input).load(args.language, args.number)
+    else:
+        pts = np.load(args.input, mmap_mode='r')[:args.number]
+    if args.landmarks:
+        pts = select_landmarks(pts, args.landmarks, args.metric, args.landmarks_output)
+    bars = compute_bars(pts, metric_name=args.metric, maxdim=args.dim, backend=args.backend,
+                        keep_infinite=args.keep_infinite, threshold=args.threshold)
+    if args.output_format == 'binary':
+        save_bars_binary(args.output, bars)
+    else:
+        save_bars_text(args.output, bars)
+
+
+if __name__ == '__main__':
+    main()
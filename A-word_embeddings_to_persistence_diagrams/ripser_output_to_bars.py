@@ -1,5 +1,6 @@
 import argparse
 import sys
+from array import array
 import numpy as np
 
 def init_args():
@@ -7,26 +8,81 @@ def init_args():
         prog='Ripser output to bars',
         description='''Takes the output from ripser and prints space separated bars, one per line.
 Dimensions are separated by empty line.
-The first line for each dimension is the dimension.''')
+The first line for each dimension is the dimension.
+With --output_format binary, saves a numpy .npz container instead, with one float64 array of shape (#bars, 2)
+(birth, death) per dimension, stored under the keys dim0, dim1, ...
+The input is parsed as it streams in, it is never held in memory as a whole.''')
 
     parser.add_argument('--keep_infinite', action='store_const', const=True, default=False,
         help='Keep the infinite bars (default: do not keep the infinite bars)')
+    parser.add_argument('--output_format', type=str, required=False, default='txt', choices=['txt', 'binary'],
+        help='Either text bars (txt) or binary .npz container (binary) (default txt)')
+    parser.add_argument('--output', '-o', type=str, required=False, default=None,
+        help='Path to the output. By default standard output used.')
 
     return parser.parse_args()
 
-def main():
-    args = init_args()
-    for row in sys.stdin.readlines():
+def parse_bar(row):
+    birth, death = row.strip()[1:].partition(')')[0].split(',')
+    return float(birth), float(death) if death.strip() else np.inf
+
+def read_ripser_output(rows, keep_infinite=False):
+    """Iterate over the rows of ripser output. Yield (dim, None) when the bars of dimension dim start
+    and (dim, (birth, death)) for every bar."""
+    dim = -1
+    for row in rows:
         if row.startswith('persistence intervals in dim'):
             dim = int(row.strip().split()[-1][:-1])
-            if dim>0:
-                print()
-            print(dim)
+            yield dim, None
         elif row.strip().startswith('['):
-            split_row = row.strip().replace('[','').replace(')','').split(',')
-            bar = tuple(float(x) if x!=' ' else np.inf for x in split_row)
-            if bar[1]<np.inf or args.keep_infinite:
-                print(f'{bar[0]:.6f} {bar[1]:.6f}')
+            bar = parse_bar(row)
+            if bar[1] < np.inf or keep_infinite:
+                yield dim, bar
+
+def write_bars_text(write_method, bars_stream):
+    for dim, bar in bars_stream:
+        if bar is None:
+            write_method(f'\n{dim}\n' if dim > 0 else f'{dim}\n')
+        else:
+            write_method(f'{bar[0]:.6f} {bar[1]:.6f}\n')
+
+def collect_bars(bars_stream):
+    """Collect the streamed bars into a list of float64 arrays of shape (#bars, 2), one per dimension."""
+    bars = []
+    for dim, bar in bars_stream:
+        if bar is None:
+            bars.extend(array('d') for _ in range(dim + 1 - len(bars)))
+        else:
+            bars[dim].extend(bar)
+    return [np.frombuffer(bars_dim, dtype='float64').reshape(-1, 2) for bars_dim in bars]
+
+def save_bars_text(file_name, bars):
+    with open(file_name, 'w') as file:
+        for dim, bars_dim in enumerate(bars):
+            file.write(f'\n{dim}\n' if dim > 0 else f'{dim}\n')
+            for birth, death in bars_dim:
+                file.write(f'{birth:.6f} {death:.6f}\n')
+
+def save_bars_binary(file_name, bars):
+    """Save the bars to the .npz container at exactly this path (np.savez would append .npz to a path without it),
+    or to this binary file object."""
+    arrays = {f'dim{dim}': np.asarray(bars_dim, dtype='float64').reshape(-1, 2) for dim, bars_dim in enumerate(bars)}
+    if hasattr(file_name, 'write'):
+        np.savez(file_name, **arrays)
+    else:
+        with open(file_name, 'wb') as file:
+            np.savez(file, **arrays)
+
+def main():
+    args = init_args()
+    bars_stream = read_ripser_output(sys.stdin, keep_infinite=args.keep_infinite)
+    if args.output_format == 'binary':
+        save_bars_binary(args.output if args.output else sys.stdout.buffer, collect_bars(bars_stream))
+    elif args.output:
+        with open(args.output, 'w') as file:
+            write_bars_text(file.write, bars_stream)
+    else:
+        write_bars_text(sys.stdout.write, bars_stream)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
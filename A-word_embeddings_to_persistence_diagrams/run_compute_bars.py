@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+SCRIPT_FOLDER = Path(__file__).resolve().parent
+
+# Rough peak memory of ripser per squared number of points, by the maximal dimension.
+# Only used until the manifest contains measured values for the same setting.
+MEMORY_BYTES_PER_SQUARED_POINT = {0: 4, 1: 12, 2: 40}
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Compute bars for many languages',
+        description='''Runs the (language, metric) barcode jobs on a pool of processes.
+The number of concurrently running jobs is limited by the number of processes and by the estimated peak memory per job.
+Jobs whose bars file already exists and is complete are skipped, so an interrupted run can be restarted.
+Wall time and peak RSS of every job are appended to a JSON-lines manifest.''')
+    parser.add_argument('--languages', '-l', type=str, nargs='+', required=True,
+                        help='List of the languages.')
+    parser.add_argument('--metrics', type=str, nargs='+', required=False, default=('euclidean', 'cosine'),
+                        choices=['euclidean', 'cosine'],
+                        help='List of the point-cloud metrics (default euclidean cosine).')
+    parser.add_argument('--number', '-n', type=int, required=False, default=10000,
+                        help='Number of words used (default 10000).')
+    parser.add_argument('--maxdim', type=int, required=False, default=2,
+                        help='Maximal degree of persistent homology to compute (default 2).')
+    parser.add_argument('--point_clouds_folder', type=str, required=False, default='data/point-clouds')
+    parser.add_argument('--bars_folder', type=str, required=False, default='data/bars')
+    parser.add_argument('--manifest', type=str, required=False, default=None,
+                        help='Path to the JSON-lines manifest (default: manifest.jsonl in the bars folder).')
+    parser.add_argument('--backend', type=str, required=False, default='ripser-cli',
+                        choices=['ripser-cli', 'in-process'],
+                        help='ripser-cli pipes the binary distance matrix into ./ripser/ripser, '
+                             'in-process uses point_cloud_to_bars.py (default ripser-cli).')
+    parser.add_argument('--cache_folder', type=str, required=False, default=None,
+                        help='If given (ripser-cli backend only), the distance matrix of the whole point cloud is cached '
+                             'in this folder once per language and metric, and runs with any --number read its prefix.')
+    parser.add_argument('--ripser', type=str, required=False, default='./ripser/ripser',
+                        help='Path to the ripser executable (default ./ripser/ripser).')
+    parser.add_argument('--processes', type=int, required=False, default=os.cpu_count(),
+                        help='Maximal number of jobs running at once (default: number of CPUs).')
+    parser.add_argument('--memory_gb', type=float, required=False, default=None,
+                        help='Memory budget for all running jobs in GB (default: 80%% of the physical memory).')
+    parser.add_argument('--job_memory_gb', type=float, required=False, default=None,
+                        help='Estimated peak memory of one job in GB. By default taken from the manifest '
+                             'if it contains a finished job with the same setting, otherwise a rough estimate.')
+
+    return parser.parse_args()
+
+
+def bars_filename(bars_folder, language, n, metric, maxdim):
+    return Path(bars_folder) / f'bars.{language}.300.n{n}.{metric}.d{maxdim}.txt'
+
+
+def point_cloud_filename(point_clouds_folder, language):
+    return Path(point_clouds_folder) / f'point-cloud.{language}.300.cut10k.npy'
+
+
+def bars_file_is_valid(filename, maxdim):
+    """A bars file is complete if it lists the dimensions 0, ..., maxdim in order."""
+    if not os.path.isfile(filename):
+        return False
+    dims = []
+    with open(filename, 'r') as file:
+        for row in file:
+            split_row = row.split()
+            if len(split_row) == 1:
+                dims.append(int(split_row[0]))
+    return dims == list(range(maxdim + 1))
+
+
+def physical_memory_gb():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 30
+
+
+def load_manifest(filename):
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, 'r') as file:
+        return [json.loads(row) for row in file if row.strip()]
+
+
+def estimate_job_memory_gb(manifest, n, maxdim, backend):
+    measured = [record['peak_rss_mb'] for record in manifest
+                if record['status'] == 'done' and record['number'] == n and record['maxdim'] == maxdim
+                and record['backend'] == backend]
+    if measured:
+        return 1.2 * max(measured) / 2 ** 10
+    return MEMORY_BYTES_PER_SQUARED_POINT.get(maxdim, MEMORY_BYTES_PER_SQUARED_POINT[2]) * n ** 2 / 2 ** 30
+
+
+def run_pipeline_ripser_cli(point_cloud, output, metric, n, maxdim, ripser, cache=None):
+    processes = []
+    try:
+        with open(output, 'w') as file:
+            processes.append(subprocess.Popen(
+                [sys.executable, SCRIPT_FOLDER / 'compute_point-cloud_distance_matrix.py', '--metric', metric,
+                 '--output_format', 'binary', '--input', point_cloud, '--input_type', 'np', '--number', str(n)]
+                + (['--cache', cache] if cache else []),
+                stdout=subprocess.PIPE))
+            processes.append(subprocess.Popen([ripser, '--format', 'binary', '--dim', str(maxdim)],
+                                              stdin=processes[-1].stdout, stdout=subprocess.PIPE))
+            processes[0].stdout.close()
+            processes.append(subprocess.Popen([sys.executable, SCRIPT_FOLDER / 'ripser_output_to_bars.py'],
+                                              stdin=processes[-1].stdout, stdout=file))
+            processes[1].stdout.close()
+            return_codes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+    if any(return_codes):
+        raise RuntimeError(f'pipeline failed with return codes {return_codes}')
+
+
+def run_pipeline_in_process(point_cloud, output, metric, n, maxdim):
+    import numpy as np
+    from point_cloud_to_bars import compute_bars
+    from ripser_output_to_bars import save_bars_text
+    pts = np.load(point_cloud, mmap_mode='r')[:n]
+    save_bars_text(output, compute_bars(pts, metric_name=metric, maxdim=maxdim))
+
+
+def run_job(job):
+    """Compute the bars of one (language, metric) job in a fresh worker process and return its manifest record."""
+    record = dict(job, host=socket.gethostname(), pid=os.getpid())
+    temporary_output = f"{job['output']}.tmp"
+    ts = time.perf_counter()
+    try:
+        if job['backend'] == 'in-process':
+            run_pipeline_in_process(job['point_cloud'], temporary_output, job['metric'], job['number'], job['maxdim'])
+        else:
+            run_pipeline_ripser_cli(job['point_cloud'], temporary_output, job['metric'], job['number'], job['maxdim'],
+                                    job['ripser'], cache=job['cache'])
+        os.replace(temporary_output, job['output'])
+        record['status'] = 'done'
+    except Exception as error:
+        record['status'] = 'failed'
+        record['error'] = repr(error)
+        if os.path.exists(temporary_output):
+            os.remove(temporary_output)
+    record['wall_time_s'] = time.perf_counter() - ts
+    # ru_maxrss is in kB on Linux; the children are the pipeline processes (ripser is typically the largest)
+    record['peak_rss_mb'] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 2 ** 10
+    return record
+
+
+def run_jobs(jobs, max_running):
+    """Run the jobs on a pool of max_running processes and yield their manifest records as they finish.
+    Only max_running jobs are submitted at a time, so that if a worker dies (e.g. killed for lack of memory), which
+    breaks the pool, the jobs that were running are recorded as failed and the others go on in a new pool."""
+    pending = list(jobs)
+    running = {}
+    while pending or running:
+        with ProcessPoolExecutor(max_workers=max_running, max_tasks_per_child=1) as executor:
+            broken = False
+            while (pending and not broken) or running:
+                while pending and not broken and len(running) < max_running:
+                    job = pending.pop(0)
+                    running[executor.submit(run_job, job)] = (job, time.perf_counter())
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, start = running.pop(future)
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool as error:
+                        broken = True
+                        yield dict(job, host=socket.gethostname(), status='failed',
+                                   error=f'worker process died (out of memory?): {error!r}',
+                                   wall_time_s=time.perf_counter() - start, peak_rss_mb=None)
+
+
+def main():
+    args = init_args()
+    manifest_filename = args.manifest if args.manifest else Path(args.bars_folder) / 'manifest.jsonl'
+    memory_budget_gb = args.memory_gb if args.memory_gb else 0.8 * physical_memory_gb()
+    job_memory_gb = args.job_memory_gb if args.job_memory_gb else estimate_job_memory_gb(
+        load_manifest(manifest_filename), args.number, args.maxdim, args.backend)
+    max_running = max(1, min(args.processes, int(memory_budget_gb // job_memory_gb)))
+
+    jobs = []
+    for metric in args.metrics:
+        for language in args.languages:
+            output = bars_filename(args.bars_folder, language, args.number, metric, args.maxdim)
+            if bars_file_is_valid(output, args.maxdim):
+                print(f'Skipping {language} {metric}: {output} already exists.')
+                continue
+            jobs.append({'language': language, 'metric': metric, 'number': args.number, 'maxdim': args.maxdim,
+                         'backend': args.backend, 'ripser': args.ripser, 'output': str(output),
+                         'point_cloud': str(point_cloud_filename(args.point_clouds_folder, language)),
+                         'cache': str(Path(args.cache_folder) / f'dmat-cache.{language}.300.cut10k.{metric}.npy')
+                         if args.cache_folder else None})
+
+    print(f'Generate barcodes start: {len(jobs)} jobs, estimated {job_memory_gb:.1f} GB per job, '
+          f'memory budget {memory_budget_gb:.1f} GB --> {max_running} jobs at once.')
+    ts = time.perf_counter()
+    with open(manifest_filename, 'a') as manifest:
+        for record in run_jobs(jobs, max_running):
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            if record['status'] == 'done':
+                print(f"    {record['language']} {record['metric']}: done, "
+                      f"time {record['wall_time_s']:.1f} s, peak RSS {record['peak_rss_mb']:.0f} MB")
+            else:
+                print(f"    {record['language']} {record['metric']}: failed, {record['error']}")
+    print(f'Generate barcodes end. Time taken: {time.perf_counter() - ts:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
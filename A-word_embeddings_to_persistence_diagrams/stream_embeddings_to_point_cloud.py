@@ -0,0 +1,86 @@
+import argparse
+import gzip
+import urllib.request
+
+import numpy as np
+
+from point_cloud_store import PointCloudStore
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Stream embeddings to point cloud',
+        description='''Reads a FastText .vec or .vec.gz file from a URL or a local path, decompressing on the fly,
+and stops reading (and downloading) as soon as the first NUMBER tokens are parsed.
+Saves the vectors as a float32 numpy file (one point per row) and the tokens to a text file, one per line.''')
+    parser.add_argument('source', type=str,
+                        help='URL (http/https) or path of the .vec or .vec.gz file')
+    parser.add_argument('outputfile', type=str,
+                        help='The output numpy (.npy) file with the point cloud')
+    parser.add_argument('--tokens_output', type=str, required=False, default=None,
+                        help='The output text file with the tokens, one per line (default: tokens are not saved)')
+    parser.add_argument('--store', type=str, required=False, default=None,
+                        help='If given, the point cloud is also added to this point-cloud store folder, replacing '
+                             'the language if it is already there (needs --language)')
+    parser.add_argument('--language', type=str, required=False, default=None,
+                        help='Language of the embeddings, the key in the point-cloud store')
+    parser.add_argument('--number', '-n', type=int, required=False, default=10000,
+                        help='Number of tokens to keep (default 10000)')
+
+    return parser.parse_args()
+
+
+def open_source(source):
+    if source.startswith(('http://', 'https://')):
+        stream = urllib.request.urlopen(source)
+    else:
+        stream = open(source, 'rb')
+    if source.endswith('.gz'):
+        return gzip.GzipFile(fileobj=stream, mode='rb'), stream
+    return stream, stream
+
+
+def read_vectors(lines, number_of_tokens):
+    """Parse the first number_of_tokens vectors from the lines of a .vec file (the first line is metadata).
+    Return the float32 array of vectors and the list of tokens."""
+    n, d = map(int, next(lines).split())
+    number_of_tokens = min(number_of_tokens, n)
+    vectors = np.empty((number_of_tokens, d), dtype='float32')
+    tokens = []
+    for i, line in zip(range(number_of_tokens), lines):
+        split_row = line.decode('utf-8').rstrip().rsplit(' ', d)
+        tokens.append(split_row[0])
+        vectors[i] = split_row[1:]
+    return vectors[:len(tokens)], tokens
+
+
+def stream_point_cloud(source, number_of_tokens):
+    stream, raw_stream = open_source(source)
+    try:
+        return read_vectors(iter(stream), number_of_tokens)
+    finally:
+        stream.close()
+        raw_stream.close()  # closing the connection stops the download
+
+
+def save_tokens(file_name, tokens):
+    with open(file_name, 'w', encoding='utf-8') as file:
+        for token in tokens:
+            file.write(token)
+            file.write('\n')
+
+
+def main():
+    args = init_args()
+    vectors, tokens = stream_point_cloud(args.source, args.number)
+    np.save(args.outputfile, vectors)
+    if args.tokens_output:
+        save_tokens(args.tokens_output, tokens)
+    if args.store:
+        # replace a language streamed before (e.g. with another --number), so the store matches the .npy file
+        PointCloudStore(args.store).add(args.language, vectors, replace=True)
+    print(f'[INFO] Saved {len(tokens)} tokens of dimension {vectors.shape[1]} to {args.outputfile}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#
+#   Tests of stream_embeddings_to_point_cloud.py against a local HTTP server standing in for the FastText server:
+#       python3 -m pytest test_stream_embeddings_to_point_cloud.py
+#
+
+import functools
+import gzip
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from point_cloud_store import PointCloudStore
+from stream_embeddings_to_point_cloud import main, stream_point_cloud
+
+
+TOKENS = ['the', ',', 'of', 'a b', 'and']  # FastText tokens may contain spaces, the vector is the last d values
+VECTORS = np.arange(15, dtype='float32').reshape(5, 3) / 4 - 1
+FILLER_TOKENS = 4_000_000  # 32 MB of further tokens, far more than the socket buffers hold
+
+
+def write_vec(path, compress, filler_tokens=0):
+    """A .vec file with TOKENS and VECTORS, followed by filler_tokens tokens (stored uncompressed in a .vec.gz, so
+    that the file is as large as its content)."""
+    lines = [f'{len(TOKENS) + filler_tokens} {VECTORS.shape[1]}\n']
+    lines += [token + ' ' + ' '.join(f'{value:.4f}' for value in vector) + ' \n' for token, vector in zip(TOKENS, VECTORS)]
+    lines.append('w 0 0 0\n' * filler_tokens)
+    opener = functools.partial(gzip.open, compresslevel=0) if compress else open
+    with opener(path, 'wt', encoding='utf-8') as file:
+        file.writelines(lines)
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    """Serves the files and counts the bytes sent in server.bytes_sent, until the client closes the connection."""
+
+    def copyfile(self, source, outputfile):
+        try:
+            while chunk := source.read(16384):
+                outputfile.write(chunk)
+                self.server.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.sent.set()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve tmp_path over HTTP on a free local port; yields the server, with its base URL in server.url."""
+    handler = functools.partial(CountingHandler, directory=str(tmp_path))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.bytes_sent = 0
+    httpd.sent = threading.Event()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('filename', ['cc.xx.300.vec.gz', 'cc.xx.300.vec'])
+def test_stream_from_url(tmp_path, server, filename):
+    write_vec(tmp_path / filename, compress=filename.endswith('.gz'), filler_tokens=FILLER_TOKENS)
+    vectors, tokens = stream_point_cloud(f'{server.url}/{filename}', 3)
+    assert tokens == TOKENS[:3]
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors, VECTORS[:3])
+    # the download stops once the tokens are read: only what the socket buffers held was sent
+    assert server.sent.wait(timeout=30)
+    assert server.bytes_sent < (tmp_path / filename).stat().st_size / 4
+
+
+def test_stream_from_path(tmp_path):
+    write_vec(tmp_path / 'cc.xx.300.vec.gz', compress=True)
+    vectors, tokens = stream_point_cloud(str(tmp_path / 'cc.xx.300.vec.gz'), 10)
+    assert tokens == TOKENS  # more tokens requested than in the file
+    np.testing.assert_array_equal(vectors, VECTORS)
+
+
+def test_stream_again_replaces_store_entry(tmp_path, monkeypatch):
+    write_vec(tmp_path / 'cc.xx.300.vec', compress=False)
+    for number in (2, 4):
+        monkeypatch.setattr('sys.argv', ['stream_embeddings_to_point_cloud.py', str(tmp_path / 'cc.xx.300.vec'),
+                                         str(tmp_path / 'point-cloud.xx.npy'), '--store', str(tmp_path / 'store'),
+                                         '--language', 'xx', '--number', str(number)])
+        main()
+    np.testing.assert_array_equal(PointCloudStore(tmp_path / 'store').load('xx'), np.load(tmp_path / 'point-cloud.xx.npy'))
+    np.testing.assert_array_equal(PointCloudStore(tmp_path / 'store').load('xx'), VECTORS[:4])
@@ -1,6 +1,8 @@
 #!/bin/zsh
 
-# note that bottleneck and sliced_wasserstain are slow compared to persistence_image and bars_statistics
+# note that bottleneck and sliced_wasserstain are slow compared to persistence_image and bars_statistics;
+# optionally, --processes 0 compares the pairs of diagrams of bottleneck on the cores allocated to the task (request them
+# with --cpus-per-task) and --distance_cache <file.sqlite> skips the distances computed before
 
 python run_compute_pd_distances.py \
     --name "euthnologue_10k_d2" \
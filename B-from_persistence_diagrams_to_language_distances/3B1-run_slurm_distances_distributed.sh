@@ -2,6 +2,20 @@
 
 # BELOW ARE A FEW EXAMPLES OF DISTRIBUTED DISTANCE MATRIX CALLS
 
+# # array 0-499: all metrics, dimensions and distances at once, split into 500 tasks of balanced estimated cost
+# # (instead of the hand-split fast and slow arrays below); replace srun and --task_id by --local_processes 8 to run on one machine
+# srun python run_compute_pd_distances_distributed.py \
+#     --name "ethnologue_10k_d2" \
+#     --output_folder "data/pd-distance-matrices/ethnologue_10k_d2/parts/" \
+#     --number 10000 \
+#     --maxdim 2 \
+#     --dimensions 0 1 2 \
+#     --metrics "euclidean" "cosine" \
+#     --distances "persistence_image" "bars_statistics" "bottleneck" "sliced_wasserstein" \
+#     --languages "af" "als" "an" "as" "ast" "bar" "be" "bg" "bn" "bpy" "br" "bs" "ca" "ckb" "co" "cs" "cy" "da" "de" "diq" "dv" "el" "en" "es" "fr" "frr" "fy" "ga" "gd" "gl" "gom" "gu" "gv" "hi" "hif" "hr" "hsb" "hy" "is" "it" "la" "lb" "li" "lmo" "lt" "mai" "mk" "mr" "mwl" "mzn" "nap" "nds" "nl" "no" "oc" "os" "pa" "pfl" "pl" "pms" "pnb" "pt" "rm" "ro" "ru" "sa" "scn" "sco" "sd" "si" "sk" "sl" "sr" "sv" "tg" "uk" "ur" "vec" "vls" "wa" "zea" \
+#     --number_of_tasks 500 \
+#     --task_id "${SLURM_ARRAY_TASK_ID}"
+
 # # array 0-388
 # srun python run_compute_pd_distances_distributed.py \
 #     --name "ethnologue_10k_d2" \
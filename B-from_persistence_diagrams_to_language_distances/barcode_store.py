@@ -0,0 +1,175 @@
+import argparse
+import fcntl
+import functools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Barcode store',
+        description='''Converts the text bars files (bars.<language>.300.n<number>.<metric>.d<maxdim>.txt, or the binary
+.npz containers with the same name) once into binary barcode stores, one per (number, metric, maxdim).
+The distance scripts load the bars from the stores, converting missing languages on first use.''')
+    parser.add_argument('--number', '-n', type=int, required=True,
+                        help='Number of words used.')
+    parser.add_argument('--maxdim', type=int, required=True,
+                        help='The maxdim used for ripser computation.')
+    parser.add_argument('--metrics', type=str, nargs='+', required=False, default=('euclidean', 'cosine'),
+                        help='List of the point-cloud metrics used.')
+    parser.add_argument('--languages', '-l', type=str, nargs='+', required=True,
+                        help='List of the languages.')
+    parser.add_argument('--bars_folder', type=str, required=False, default='data/bars',
+                        help='Folder with the bars files (default data/bars).')
+    parser.add_argument('--store_folder', type=str, required=False, default=None,
+                        help='Folder of the barcode stores (default: the folder "store" in the bars folder).')
+
+    return parser.parse_args()
+
+
+def parse_bars_text(filename):
+    """Parse a text bars file: for every dimension a line with the dimension, then one bar per line (birth death),
+    dimensions separated by an empty line. Return a list of float64 arrays of shape (#bars, 2), one per dimension."""
+    bars = []
+    with open(filename, 'r') as file:
+        for row in file:
+            split_row = row.split()
+            if len(split_row) == 1:
+                bars.append([])
+            elif len(split_row) == 2:
+                bars[-1].extend(split_row)
+    return [np.array(bars_dim, dtype='float64').reshape(-1, 2) for bars_dim in bars]
+
+
+def bars_filename(bars_folder, language, n, metric, maxdim):
+    """The binary .npz bars file if it exists, otherwise the text one."""
+    filename = Path(bars_folder) / f'bars.{language}.300.n{n}.{metric}.d{maxdim}'
+    if Path(f'{filename}.npz').exists():
+        return Path(f'{filename}.npz')
+    return Path(f'{filename}.txt')
+
+
+def read_bars_file(filename):
+    if filename.suffix == '.npz':
+        with np.load(filename) as container:
+            return [container[f'dim{dim}'] for dim in range(len(container.files))]
+    return parse_bars_text(filename)
+
+
+def file_signature(filename):
+    """The modification time (ns) and size of the file, or None if it does not exist."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class BarcodeStore:
+    """Bars of all languages for one (number of words, metric, maxdim), stored in one raw float64 file
+    of (birth, death) rows, with a JSON index language -> [(offset, rows) for every dimension]
+    and language -> signature (see file_signature) of the bars file the bars were converted from.
+    Adding languages is guarded by a lock file, so several processes can fill the store at once."""
+
+    def __init__(self, folder, n, metric, maxdim):
+        self.folder = Path(folder)
+        name = f'barcodes.n{n}.{metric}.d{maxdim}'
+        self.data_filename = self.folder / f'{name}.f64'
+        self.index_filename = self.folder / f'{name}.index.json'
+        self.lock_filename = self.folder / f'{name}.lock'
+        self.index = {'rows': 0, 'languages': {}, 'sources': {}}
+        self._data = None
+        self._load_index()
+
+    def __contains__(self, language):
+        return language in self.index['languages']
+
+    @property
+    def languages(self):
+        return list(self.index['languages'])
+
+    def source(self, language):
+        return self.index.get('sources', {}).get(language)
+
+    def add(self, language, bars, source=None):
+        """Add the bars of the language, converted from a bars file with the given signature. If the language is
+        already stored from another version of the file, the new bars are appended and the index points to them."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_filename, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load_index()
+            if language in self and (source is None or self.source(language) == source):
+                return
+            offset = self.index['rows']
+            entry = []
+            with open(self.data_filename, 'r+b' if self.data_filename.exists() else 'wb') as file:
+                file.seek(offset * 2 * 8)
+                for bars_dim in bars:
+                    bars_dim = np.ascontiguousarray(bars_dim, dtype='float64').reshape(-1, 2)
+                    file.write(bars_dim.tobytes())
+                    entry.append((offset, len(bars_dim)))
+                    offset += len(bars_dim)
+                file.truncate()
+                file.flush()
+                os.fsync(file.fileno())
+            self.index['languages'][language] = entry
+            self.index.setdefault('sources', {})[language] = source
+            self.index['rows'] = offset
+            temporary_filename = f'{self.index_filename}.tmp'
+            with open(temporary_filename, 'w') as file:
+                json.dump(self.index, file)
+            os.replace(temporary_filename, self.index_filename)
+
+    def load(self, language):
+        """Return the bars of the language as a list of read-only (#bars, 2) arrays, one per dimension.
+        The arrays are views into the memory-mapped store, nothing is parsed or copied."""
+        if language not in self:
+            self._load_index()
+        data = self._map_data()
+        return [data[offset:offset + rows] for offset, rows in self.index['languages'][language]]
+
+    def _load_index(self):
+        if self.index_filename.exists():
+            with open(self.index_filename, 'r') as file:
+                self.index = json.load(file)
+
+    def _map_data(self):
+        if self._data is None or len(self._data) < self.index['rows']:
+            if self.index['rows'] == 0:
+                return np.empty((0, 2), dtype='float64')
+            self._data = np.memmap(self.data_filename, dtype='float64', mode='r',
+                                   shape=(self.index['rows'], 2)).view(np.ndarray)
+        return self._data
+
+
+@functools.lru_cache(maxsize=None)
+def open_barcode_store(store_folder, n, metric, maxdim):
+    return BarcodeStore(store_folder, n, metric, maxdim)
+
+
+def load_bars(language, n, metric, maxdim, bars_folder='data/bars', store_folder=None):
+    """Load the bars of the language as a list of float64 arrays of shape (#bars, 2), one per dimension.
+    The bars are read from the barcode store; a language missing from the store, or whose bars file changed since it was
+    converted, is converted from its bars file first."""
+    store = open_barcode_store(str(store_folder if store_folder else Path(bars_folder) / 'store'), n, metric, maxdim)
+    filename = bars_filename(bars_folder, language, n, metric, maxdim)
+    source = file_signature(filename)
+    if language not in store or (source is not None and store.source(language) != source):
+        store.add(language, read_bars_file(filename), source=source)
+    return store.load(language)
+
+
+def main():
+    args = init_args()
+    for metric in args.metrics:
+        for language in args.languages:
+            load_bars(language, args.number, metric, args.maxdim, bars_folder=args.bars_folder,
+                      store_folder=args.store_folder)
+        print(f'Barcode store for {metric} metric contains {len(args.languages)} languages.')
+
+
+if __name__ == '__main__':
+    main()
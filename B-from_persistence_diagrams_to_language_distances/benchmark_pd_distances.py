@@ -0,0 +1,206 @@
+#
+#   Benchmark of the vectorisations and the distances between persistence diagrams, on seeded synthetic diagrams.
+#   Record a baseline:
+#       python benchmark_pd_distances.py --output outputs/benchmark_pd_distances.json
+#   and compare with it later (fails with exit code 1 if a case got slower by more than the threshold):
+#       python benchmark_pd_distances.py --baseline outputs/benchmark_pd_distances.json --threshold 0.25
+#   For the folders used, search for comments PATH TO DATA
+#
+
+import argparse
+import json
+import platform
+import socket
+import sys
+import time
+import timeit
+
+import gudhi
+import numpy as np
+import persim
+
+from barcode_store import load_bars
+from pd_distances import (compare_pds, distance_parameters, sliced_wasserstein_from_projections,
+                          sliced_wasserstein_projections)
+from pd_vectorisation import (persistence_image_parameters, persistence_landscape_parameters, vectorise_bars_statistics,
+                              vectorise_persistence_image, vectorise_persistence_images, vectorise_persistence_landscape,
+                              vectorise_persistence_landscapes)
+
+
+# (metric, dimension) -> (bars per word, mean and standard deviation of the births, mean and standard deviation of
+# the logarithm of the persistences), as in barcodes of 300 words; refit with --profile_languages
+BAR_PROFILES = {
+    ('euclidean', 0): (1.0, 0.0, 0.0, 0.70, 0.25),
+    ('euclidean', 1): (0.91, 2.53, 0.50, -2.06, 1.20),
+    ('euclidean', 2): (0.47, 2.98, 0.47, -2.79, 1.18),
+    ('cosine', 0): (1.0, 0.0, 0.0, -1.99, 0.41),
+    ('cosine', 1): (1.11, 0.26, 0.07, -3.37, 1.15),
+    ('cosine', 2): (0.92, 0.43, 0.08, -3.84, 1.25),
+}
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Benchmark persistence diagram vectorisations and distances')
+    parser.add_argument('--sizes', type=int, nargs='+', required=False, default=(100, 300, 1000),
+                        help='Numbers of words of the synthetic diagrams (default 100 300 1000).')
+    parser.add_argument('--metrics', type=str, nargs='+', required=False, default=('euclidean', 'cosine'),
+                        help='List of the point-cloud metrics whose bar profiles are used.')
+    parser.add_argument('--dimensions', type=int, nargs='+', required=False, default=(0, 1, 2),
+                        help='List of the homology dimensions.')
+    parser.add_argument('--distances', type=str, nargs='+', required=False,
+                        default=('bottleneck', 'sliced_wasserstein'),
+                        choices=('bottleneck', 'bottleneck_tiered', 'sliced_wasserstein', 'wasserstein'),
+                        help='List of the distances between diagrams to time, as computed by the scripts (default '
+                             'bottleneck sliced_wasserstein); the vectorisation distances only time the vectorisations.')
+    parser.add_argument('--batch', type=int, required=False, default=10,
+                        help='Number of synthetic diagrams of the batched cases, as of languages (default 10).')
+    parser.add_argument('--seed', type=int, required=False, default=0,
+                        help='Seed of the synthetic diagrams (default 0).')
+    parser.add_argument('--repeats', type=int, required=False, default=5,
+                        help='The best of this many timings is taken (default 5).')
+    parser.add_argument('--profile_languages', type=str, nargs='+', required=False, default=None,
+                        help='If given, the bar profiles are fitted to the barcodes of these languages.')
+    parser.add_argument('--profile_number', type=int, required=False, default=300,
+                        help='Number of words of the barcodes of --profile_languages (default 300).')
+    parser.add_argument('--profile_maxdim', type=int, required=False, default=2,
+                        help='The maxdim of the barcodes of --profile_languages (default 2).')
+    parser.add_argument('--output', type=str, required=False, default=None,
+                        help='If given, the results are saved to this JSON file (e.g. as a new baseline).')
+    parser.add_argument('--baseline', type=str, required=False, default=None,
+                        help='If given, the results are compared with this JSON file of an earlier run.')
+    parser.add_argument('--threshold', type=float, required=False, default=0.25,
+                        help='Relative slowdown against the baseline counted as a regression (default 0.25).')
+    parser.add_argument('--min_seconds', type=float, required=False, default=1e-4,
+                        help='Slowdowns smaller than this many seconds are not counted as regressions (default 1e-4).')
+
+    return parser.parse_args()
+
+
+def fit_bar_profiles(languages, n, maxdim, metrics, dimensions):
+    """The bar profiles (see BAR_PROFILES) of the barcodes of the languages."""
+    profiles = {}
+    for metric in metrics:
+        bars = [load_bars(language, n, metric, maxdim, bars_folder='data/bars') for language in languages]  # PATH TO DATA
+        for dimension in dimensions:
+            diagrams = [np.asarray(bars_of_language[dimension], dtype='float64') for bars_of_language in bars]
+            pd = np.concatenate(diagrams)
+            log_persistences = np.log(np.maximum(pd[:, 1] - pd[:, 0], 1e-12))
+            profiles[metric, dimension] = (np.mean([len(diagram) for diagram in diagrams]) / n,
+                                           float(np.mean(pd[:, 0])), float(np.std(pd[:, 0])),
+                                           float(np.mean(log_persistences)), float(np.std(log_persistences)))
+    return profiles
+
+
+def synthetic_diagram(rng, n, metric, dimension, profiles=BAR_PROFILES):
+    """A random diagram with the bar profile of the metric and dimension for n words: n - 1 bars born at 0 in
+    dimension 0, otherwise normally distributed (absolute) births; log-normally distributed persistences."""
+    bars_per_word, birth_mean, birth_std, log_mean, log_std = profiles[metric, dimension]
+    size = n - 1 if dimension == 0 else int(round(bars_per_word * n))
+    births = np.zeros(size) if dimension == 0 else np.abs(rng.normal(birth_mean, birth_std, size))
+    return np.column_stack([births, births + rng.lognormal(log_mean, log_std, size)])
+
+
+def time_call(function, repeats=5):
+    """Best time of one call, in seconds, over the repeats (each of enough calls to take at least 0.2 s)."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number
+
+
+def benchmark(sizes, metrics, dimensions, distances, seed=0, repeats=5, profiles=BAR_PROFILES, batch=10):
+    """Return the dictionary case -> seconds, where the case is '<function>|<metric>|d<dimension>|n<words>'.
+
+    The distances are timed as the scripts compute them, sliced Wasserstein from the projections of the diagrams
+    (projecting a diagram is a case of its own). The batched vectorisations ('<function>[<batch>]') get a batch of diagrams, as of the languages.
+    """
+    rng = np.random.default_rng(seed)
+    results = {}
+    for n in sizes:
+        for metric in metrics:
+            for dimension in dimensions:
+                pds = [synthetic_diagram(rng, n, metric, dimension, profiles) for _ in range(max(batch, 2))]
+                pd1, pd2 = pds[:2]
+                image_parameters = persistence_image_parameters(metric, dimension)
+                landscape_parameters = persistence_landscape_parameters(metric, dimension)
+                cases = {
+                    'vectorise_persistence_image': lambda: vectorise_persistence_image(pd1, **image_parameters),
+                    f'vectorise_persistence_images[{batch}]': lambda: vectorise_persistence_images(
+                        pds[:batch], **image_parameters),
+                    'vectorise_persistence_landscape': lambda: vectorise_persistence_landscape(
+                        pd1, **landscape_parameters),
+                    f'vectorise_persistence_landscapes[{batch}]': lambda: vectorise_persistence_landscapes(
+                        pds[:batch], **landscape_parameters),
+                    'vectorise_bars_statistics': lambda: vectorise_bars_statistics(pd1, only_death=dimension == 0),
+                }
+                for distance in distances:
+                    parameters = distance_parameters(metric, dimension, distance)
+                    if distance == 'sliced_wasserstein':
+                        projections1 = sliced_wasserstein_projections(pd1, **parameters)
+                        projections2 = sliced_wasserstein_projections(pd2, **parameters)
+                        cases['sliced_wasserstein_projections'] = (
+                            lambda parameters=parameters: sliced_wasserstein_projections(pd1, **parameters))
+                        cases['sliced_wasserstein_from_projections'] = (
+                            lambda projections1=projections1, projections2=projections2:
+                            sliced_wasserstein_from_projections(projections1, projections2))
+                    else:
+                        cases[f'compare_pds[{distance}]'] = (
+                            lambda distance=distance, parameters=parameters: compare_pds(pd1, pd2, distance,
+                                                                                         **parameters))
+                for name, function in cases.items():
+                    case = f'{name}|{metric}|d{dimension}|n{n}'
+                    results[case] = time_call(function, repeats=repeats)
+                    print(f'{case:>60}: {1000 * results[case]:10.3f} ms ({len(pd1)} bars)', flush=True)
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold, min_seconds):
+    """Print the ratios of the times to the baseline and return the list of the regressed cases."""
+    regressions = []
+    print(f'{"case":>60} {"baseline ms":>12} {"ms":>10} {"ratio":>7}')
+    for case, seconds in results.items():
+        if case not in baseline:
+            continue
+        ratio = seconds / baseline[case]
+        regressed = ratio > 1 + threshold and seconds - baseline[case] > min_seconds
+        if regressed:
+            regressions.append(case)
+        print(f'{case:>60} {1000 * baseline[case]:12.3f} {1000 * seconds:10.3f} {ratio:7.2f}'
+              + ('  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    args = init_args()
+    profiles = BAR_PROFILES
+    if args.profile_languages:
+        profiles = fit_bar_profiles(args.profile_languages, args.profile_number, args.profile_maxdim, args.metrics,
+                                    args.dimensions)
+
+    results = benchmark(args.sizes, args.metrics, args.dimensions, args.distances, seed=args.seed,
+                        repeats=args.repeats, profiles=profiles, batch=args.batch)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'environment': {'host': socket.gethostname(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                       'python': platform.python_version(), 'numpy': np.__version__,
+                                       'gudhi': gudhi.__version__, 'persim': persim.__version__},
+                       'seed': args.seed,
+                       'batch': args.batch,
+                       'profiles': {f'{metric}|d{dimension}': profile
+                                    for (metric, dimension), profile in profiles.items()},
+                       'results': results}, file, indent=2)
+        print(f'Results saved to: {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)['results']
+        regressions = compare_with_baseline(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f'{len(regressions)} regressions beyond {100 * args.threshold:.0f}%: {", ".join(regressions)}')
+            sys.exit(1)
+        print(f'No regressions beyond {100 * args.threshold:.0f}%')
+
+
+if __name__ == '__main__':
+    main()
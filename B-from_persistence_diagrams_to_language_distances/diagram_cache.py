@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(item) for item in value)
+    return 0
+
+
+class LRUCache:
+    """Least-recently-used cache of numpy arrays (or lists of them), bounded by the total size of the arrays in bytes.
+    The most recently used item is always kept, even if it alone exceeds the bound."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, compute):
+        """Return the cached value for the key, computing it by compute() on a miss."""
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+        self.misses += 1
+        value = compute()
+        size = nbytes(value)
+        self._items[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.total_bytes -= evicted_size
+        return value
+
+    def statistics(self):
+        return (f'cache: {len(self)} items, {self.total_bytes / 2 ** 20:.1f} MB, '
+                f'{self.hits} hits, {self.misses} misses')
@@ -0,0 +1,84 @@
+import json
+import os
+
+import numpy as np
+
+
+COLUMNS = ('job_id', 'parameter_index', 'language_1', 'language_2', 'value', 'error')
+
+
+def save_part_npz(filename, experiment_name, n, parameters, languages, columns):
+    """Save the distances of a task as columns (job ids, indices into parameters and languages, values, error bounds),
+    with the experiment name, number of words, parameters and languages stored once per file."""
+    temporary_filename = f'{filename}.tmp'  # not .npz, so that the merge script skips a part being written
+    with open(temporary_filename, 'wb') as file:  # np.savez would append .npz to the file name
+        np.savez(file,
+                 experiment_name=experiment_name,
+                 words=n,
+                 embedding_dimension=300,
+                 parameters=json.dumps(parameters),
+                 languages=json.dumps(languages),
+                 job_id=np.array(columns['job_id'], dtype='int64'),
+                 parameter_index=np.array(columns['parameter_index'], dtype='int32'),
+                 language_1=np.array(columns['language_1'], dtype='int32'),
+                 language_2=np.array(columns['language_2'], dtype='int32'),
+                 value=np.array(columns['value'], dtype='float64'),
+                 error=np.array(columns['error'], dtype='float64'))
+    os.replace(temporary_filename, filename)
+
+
+def save_part_json(filename, experiment_name, n, parameters, languages, columns):
+    """Save the distances of a task as the list of one dictionary per distance (the original format of the parts)."""
+    results = []
+    for job_id, k, i, j, value, error in zip(*(columns[column] for column in COLUMNS)):
+        metric, dimension, distance = parameters[k]
+        results.append({
+            'experiment_name': experiment_name,
+            'words': n,
+            'embedding_dimension': 300,
+            'job_id': job_id,
+            'metric': metric,
+            'persistent_diagram_dim': dimension,
+            'pd_metric': distance,
+            'languages': sorted([languages[i], languages[j]]),
+            'value': value,
+            'error': error
+        })
+    temporary_filename = f'{filename}.tmp'
+    with open(temporary_filename, 'w') as file:
+        json.dump(results, file)
+    os.replace(temporary_filename, filename)
+
+
+def read_part(filename):
+    """Read a part in either format. Return the experiment name, the number of words, the lists of the parameters
+    (metric, dimension, distance) and the languages, and the dictionary of the columns (see COLUMNS) indexing them."""
+    if str(filename).endswith('.npz'):
+        with np.load(filename) as part:
+            return (str(part['experiment_name']), int(part['words']),
+                    [tuple(parameter) for parameter in json.loads(str(part['parameters']))],
+                    json.loads(str(part['languages'])),
+                    {column: part[column] for column in COLUMNS})
+    with open(filename, 'r') as file:
+        data = json.load(file)
+    experiment_names = {entry['experiment_name'] for entry in data}
+    words = {entry['words'] for entry in data}
+    if len(experiment_names) > 1:
+        raise ValueError(f'The experiment_name is inconsistent for {filename}')
+    if len(words) > 1:
+        raise ValueError(f'The number of words is inconsistent for {filename}')
+    parameters = sorted({(entry['metric'], entry['persistent_diagram_dim'], entry['pd_metric']) for entry in data})
+    languages = sorted({language for entry in data for language in entry['languages']})
+    parameter_to_index = {parameter: k for k, parameter in enumerate(parameters)}
+    language_to_index = {language: i for i, language in enumerate(languages)}
+    columns = {
+        'job_id': np.array([entry.get('job_id', -1) for entry in data], dtype='int64'),
+        'parameter_index': np.array([parameter_to_index[entry['metric'], entry['persistent_diagram_dim'],
+                                                        entry['pd_metric']] for entry in data], dtype='int32'),
+        'language_1': np.array([language_to_index[entry['languages'][0]] for entry in data], dtype='int32'),
+        'language_2': np.array([language_to_index[entry['languages'][1]] for entry in data], dtype='int32'),
+        'value': np.array([entry['value'] for entry in data], dtype='float64'),
+        'error': np.array([entry.get('error', 0) for entry in data], dtype='float64')
+    }
+    return (experiment_names.pop() if data else None, words.pop() if data else None,
+            parameters, languages, columns)
@@ -0,0 +1,85 @@
+import heapq
+
+import numpy as np
+
+from barcode_store import load_bars
+
+
+def pair_to_number(i, j):
+    return i * (i - 1) // 2 + j
+
+
+def number_to_pair(index):
+    i = int((1 + (1 + 8 * index) ** (1 / 2)) / 2)
+    j = index - (i * (i - 1) // 2)
+    return i, j
+
+
+def job_id_to_parameter_indices(job_id, number_of_parameters, number_of_languages):
+    k = job_id % number_of_parameters
+    number = job_id // number_of_parameters
+    i, j = number_to_pair(number)
+    return k, (i, j)
+
+
+def estimate_job_cost(distance, size_1, size_2, dimension=None):
+    """Relative cost of one distance between diagrams with size_1 and size_2 bars (only the ratios matter).
+
+    The bottleneck matching grows as about size^1.5 log(size) (size log(size) in dimension 0, where the births are 0
+    and the distance is computed from the sorted deaths), sliced Wasserstein merges the sorted projections along
+    50 directions, the Wasserstein distance of gudhi.hera grows as about size^2 (a dynamic programme over the
+    size_1 x size_2 pairs of deaths in dimension 0), and the vectorisations are computed once per diagram and cached,
+    so a pair only costs a vector norm.
+    """
+    size = size_1 + size_2 + 1
+    if distance in ('bottleneck', 'bottleneck_tiered') and dimension == 0:
+        return size * np.log2(size + 1)
+    if distance in ('bottleneck', 'bottleneck_tiered'):  # an upper estimate for the tiered one
+        return size ** 1.5 * np.log2(size + 1)
+    if distance == 'sliced_wasserstein':
+        return 50 * size
+    if distance == 'wasserstein' and dimension == 0:
+        return size_1 * size_2
+    if distance == 'wasserstein':
+        return size ** 2
+    return size
+
+
+def job_costs(parameters, languages, diagram_size):
+    """Estimated costs of all the jobs, in the order of the job ids; diagram_size(language, metric, dimension)
+    returns the number of bars of the diagram."""
+    number_of_jobs = len(parameters) * len(languages) * (len(languages) - 1) // 2
+    costs = np.empty(number_of_jobs)
+    for job_id in range(number_of_jobs):
+        k, (i, j) = job_id_to_parameter_indices(job_id, len(parameters), len(languages))
+        metric, dimension, distance = parameters[k]
+        costs[job_id] = estimate_job_cost(distance, diagram_size(languages[i], metric, dimension),
+                                          diagram_size(languages[j], metric, dimension), dimension=dimension)
+    return costs
+
+
+def schedule_jobs(costs, number_of_tasks):
+    """Split the jobs into tasks of balanced total cost by the longest-processing-time-first rule: going from the most
+    expensive job down, every job goes to the task with the smallest total cost so far. The schedule is deterministic,
+    so every task of an array computes the same one. Return the list of the (sorted) job ids of every task."""
+    tasks = [[] for _ in range(number_of_tasks)]
+    loads = [(0.0, task_id) for task_id in range(number_of_tasks)]
+    for job_id in sorted(range(len(costs)), key=lambda job: (-costs[job], job)):
+        load, task_id = heapq.heappop(loads)
+        tasks[task_id].append(job_id)
+        heapq.heappush(loads, (load + costs[job_id], task_id))
+    return [sorted(jobs) for jobs in tasks]
+
+
+def task_schedule(parameters, languages, n, maxdim, batch_size=100, number_of_tasks=0):
+    """The job ids of every task: consecutive batches of batch_size jobs, or (if number_of_tasks is positive)
+    the cost-balanced schedule of the jobs into number_of_tasks tasks."""
+    number_of_jobs = len(parameters) * len(languages) * (len(languages) - 1) // 2
+    if number_of_tasks <= 0:
+        return [list(range(start, min(start + batch_size, number_of_jobs)))
+                for start in range(0, number_of_jobs, batch_size)]
+
+    def diagram_size(language, metric, dimension):
+        return len(load_bars(language, n, metric, maxdim, bars_folder='data/bars')[dimension])  # PATH TO DATA
+
+    return schedule_jobs(job_costs(parameters, languages, diagram_size), number_of_tasks)
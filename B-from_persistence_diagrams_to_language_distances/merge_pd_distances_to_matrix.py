@@ -5,6 +5,9 @@ import json
 from pathlib import Path
 import os
 
+from distance_parts import read_part
+from job_scheduling import pair_to_number, task_schedule
+
 def init_args():
     parser = argparse.ArgumentParser(
         prog='Compute persistence diagram distances')
@@ -26,7 +29,11 @@ def init_args():
     parser.add_argument('--metrics', type=str, nargs='+', required=True,
         help='List of the point-cloud metrics used.')
     parser.add_argument('--languages', type=str, nargs='+', required=True,
-        help='List of the languages.')
+        help='List of the languages (in the order given to the distributed script, for the job ids of missing values).')
+    parser.add_argument('--batch_size', type=int, required=False, default=0,
+        help='The batch size given to the distributed script -- used only to list the task ids of missing values.')
+    parser.add_argument('--number_of_tasks', type=int, required=False, default=0,
+        help='The number of tasks given to the distributed script -- used only to list the task ids of missing values.')
 
     return parser.parse_args()
 
@@ -37,6 +44,15 @@ def save_matrix(filename, mat, labels, line_sep='\n', decimal_places=10):
             if i > 0:
                 file.write(' '.join([f'{x : .{decimal_places}f}' for x in row[:i]]) + line_sep)
 
+def missing_jobs(matrices_check, parameters, languages, input_languages):
+    """Job ids (of the distributed script, given the languages in its order) of the values missing in the matrices."""
+    input_language_index = np.array([input_languages.index(lang) for lang in languages])
+    job_ids = []
+    for k, i, j in zip(*np.nonzero(~matrices_check)):
+        i, j = sorted([input_language_index[i], input_language_index[j]], reverse=True)
+        job_ids.append(pair_to_number(int(i), int(j)) * len(parameters) + int(k))
+    return sorted(job_ids)
+
 def main():
     args = init_args()
     experiment_name = args.name
@@ -51,44 +67,69 @@ def main():
     dimensions = args.dimensions
     distances = args.distances
     parameters = [(metric, dimension, distance) for metric in metrics for dimension in dimensions for distance in distances]
+    parameter_to_index = {parameter_tuple: k for k, parameter_tuple in enumerate(parameters)}
 
-    matrices = {
-        parameter_tuple : np.zeros((len(languages), len(languages)), dtype=float)
-        for parameter_tuple in parameters
-    }
-    matrices_check = {
-        parameter_tuple : np.triu(np.ones((len(languages), len(languages)), dtype=bool), 0)
-        for parameter_tuple in parameters
-    }
-    
-    filename_list = [filename for filename in os.listdir(data_folder) if filename.startswith(f'distances.{experiment_name}') and filename.endswith('.json')]
-    print(f'Collected {len(filename_list)} data files in {data_folder}.')
-    for filename in filename_list:
-        with open(data_folder / filename, 'r') as file:
-            data = json.load(file)
-        for data_entry in data:
-            # === CHECK ===
-            if not data_entry['words'] == n:
-               raise ValueError(f'The number of words is inconsistent for {filename}')
-            if not data_entry['experiment_name'] == experiment_name:
-               raise ValueError(f'The experiment_name is inconsistent for {filename}')
-            # =============
-            metric = data_entry['metric']
-            dimension = data_entry['persistent_diagram_dim']
-            distance = data_entry['pd_metric']
-            if (metric, dimension, distance) in parameters:
-                i, j = sorted([language_to_index[lang] for lang in data_entry['languages']], reverse=True)
-                matrices[(metric, dimension, distance)][i,j] = data_entry['value']
-                matrices_check[(metric, dimension, distance)][i,j] = True
+    matrices = np.zeros((len(parameters), len(languages), len(languages)), dtype=float)
+    errors = np.zeros((len(parameters), len(languages), len(languages)), dtype=float)
+    matrices_check = np.tile(np.triu(np.ones((len(languages), len(languages)), dtype=bool), 0), (len(parameters), 1, 1))
 
-    for metric, dimension, distance in parameters:
-        if matrices_check[(metric, dimension, distance)].all():
+    number_of_files = 0
+    for entry in os.scandir(data_folder):
+        filename = entry.name
+        if not (filename.startswith(f'distances.{experiment_name}') and filename.endswith(('.json', '.npz'))):
+            continue
+        number_of_files += 1
+        part_experiment_name, part_words, part_parameters, part_languages, columns = read_part(data_folder / filename)
+        if not len(columns['value']):
+            continue
+        # === CHECK ===
+        if not part_words == n:
+           raise ValueError(f'The number of words is inconsistent for {filename}')
+        if not part_experiment_name == experiment_name:
+           raise ValueError(f'The experiment_name is inconsistent for {filename}')
+        unknown_languages = set(part_languages) - set(languages)
+        if unknown_languages:
+            raise ValueError(f'Unknown languages {sorted(unknown_languages)} in {filename}')
+        # =============
+        parameter_map = np.array([parameter_to_index.get(parameter_tuple, -1) for parameter_tuple in part_parameters])
+        language_map = np.array([language_to_index[lang] for lang in part_languages])
+        ks = parameter_map[columns['parameter_index']]
+        rows = language_map[columns['language_1']]
+        cols = language_map[columns['language_2']]
+        selected = ks >= 0
+        ks, rows, cols = ks[selected], np.maximum(rows, cols)[selected], np.minimum(rows, cols)[selected]
+        matrices[ks, rows, cols] = columns['value'][selected]
+        errors[ks, rows, cols] = columns['error'][selected]
+        matrices_check[ks, rows, cols] = True
+    print(f'Collected {number_of_files} data files in {data_folder}.')
+
+    for k, (metric, dimension, distance) in enumerate(parameters):
+        if matrices_check[k].all():
             print(f'Matrix for {(metric, dimension, distance)} succesfully constructed.')
             output_matrix_filename = output_folder / f"pddmat.{experiment_name}.n{n}.{metric}.{distance}.d{dimension}.txt"
-            save_matrix(output_matrix_filename, matrices[(metric, dimension, distance)], languages)
+            save_matrix(output_matrix_filename, matrices[k], languages)
             print(f'    Saved to > {output_matrix_filename}')
+            if errors[k].any():
+                output_errors_filename = output_folder / f"pddmat.{experiment_name}.n{n}.{metric}.{distance}.d{dimension}.error.txt"
+                save_matrix(output_errors_filename, errors[k], languages)
+                print(f'    Largest error bound {errors[k].max() : .10f}, error bounds saved to > {output_errors_filename}')
         else:
-            print(f'Matrix for {(metric, dimension, distance)} HAS INCOMPLETE DATA! Missing {(1 - matrices_check[(metric, dimension, distance)]).sum()} values.')
+            print(f'Matrix for {(metric, dimension, distance)} HAS INCOMPLETE DATA! Missing {(1 - matrices_check[k]).sum()} values.')
+
+    if not matrices_check.all():
+        job_ids = missing_jobs(matrices_check, parameters, languages, list(args.languages))
+        missing = {'job_ids': job_ids}
+        if args.batch_size > 0 or args.number_of_tasks > 0:
+            maxdim = args.maxdim if args.maxdim > -1 else max(dimensions)
+            tasks = task_schedule(parameters, list(args.languages), n, maxdim, batch_size=args.batch_size,
+                                  number_of_tasks=args.number_of_tasks)
+            job_to_task = {job_id: task_id for task_id, task in enumerate(tasks) for job_id in task}
+            missing['task_ids'] = sorted({job_to_task[job_id] for job_id in job_ids})
+            print(f'Tasks to resubmit (--array): {",".join(map(str, missing["task_ids"]))}')
+        missing_filename = output_folder / f'missing.{experiment_name}.json'
+        with open(missing_filename, 'w') as file:
+            json.dump(missing, file)
+        print(f'{len(job_ids)} missing jobs listed in > {missing_filename}')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
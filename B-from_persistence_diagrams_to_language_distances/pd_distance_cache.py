@@ -0,0 +1,54 @@
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+
+def diagram_hash(pd):
+    """Hash of the content of the diagram (the float64 bars), independent of the language and file it comes from."""
+    pd = np.ascontiguousarray(pd, dtype='float64').reshape(-1, 2)
+    return hashlib.sha256(pd.tobytes()).hexdigest()
+
+
+def distance_key(hash_1, hash_2, distance, parameters):
+    """Key of the distance between two diagrams; symmetric in the diagrams."""
+    description = json.dumps([distance, parameters, sorted([hash_1, hash_2])], sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class DistanceCache:
+    """Persistent cache of distances between persistence diagrams in an SQLite file, keyed by distance_key, so that
+    a distance between the same two diagrams with the same parameters is never computed twice. Several processes,
+    also on different hosts, can share the file (on a filesystem with working locks): it uses the rollback journal,
+    not WAL, whose shared-memory index only works on one host, and waits for the locks of the other processes."""
+
+    def __init__(self, filename, timeout=600):
+        self.connection = sqlite3.connect(filename, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=DELETE')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS distances '
+                                '(key TEXT PRIMARY KEY, value REAL NOT NULL, error REAL NOT NULL)')
+        self.connection.commit()
+
+    def get_many(self, keys):
+        """Return the dictionary key -> (distance, error bound) of the given keys present in the cache."""
+        keys = list(keys)
+        values = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute(
+                f'SELECT key, value, error FROM distances WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+            values.update((key, (value, error)) for key, value, error in rows)
+        return values
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, values):
+        """Store the distances of a dictionary key -> (distance, error bound)."""
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO distances (key, value, error) VALUES (?, ?, ?)',
+                                        [(key, float(value), float(error)) for key, (value, error) in values.items()])
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,130 @@
+#
+#   Metrics of the distance computation: the scripts run with --log_metrics write one JSON record per job (per matrix
+#   for run_compute_pd_distances.py) to metrics.<name>[.part<task_id>].jsonl, and this script aggregates them:
+#       python pd_metrics.py outputs/pd_distances_<name>/metrics.<name>*.jsonl
+#
+
+import argparse
+import json
+import os
+import resource
+import socket
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+PHASES = ('load', 'vectorise', 'compare', 'write')
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process and of its terminated child processes (e.g. the workers of a shut down
+    process pool) so far, in MB."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, kB on Linux
+
+
+class PhaseTimer:
+    """Accumulates the time spent in the phases of a job, and the peak RSS of the worker processes that ran parts of
+    it (still running, so not in the peak RSS of the child processes), if any."""
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.workers_peak_rss_mb = None
+
+    def add_worker_peak_rss(self, peak):
+        self.workers_peak_rss_mb = max(peak, self.workers_peak_rss_mb or 0.0)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class MetricsLog:
+    """Appends JSON records (one per line) to the file, each with the given common fields (e.g. experiment and task id),
+    the host, the process id, the time and the peak RSS of the process, its children and the workers of the timer."""
+
+    def __init__(self, filename, **common):
+        self.file = open(filename, 'a')
+        self.common = dict(common, host=socket.gethostname(), pid=os.getpid())
+
+    def write(self, record, timer=None, **fields):
+        entry = dict(self.common, record=record, **fields)
+        peak = peak_rss_mb()
+        if timer is not None:
+            entry['phases'] = timer.phases
+            if timer.workers_peak_rss_mb is not None:
+                entry['workers_peak_rss_mb'] = timer.workers_peak_rss_mb
+                peak = max(peak, timer.workers_peak_rss_mb)
+        entry.update(time=time.time(), peak_rss_mb=peak)
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(filenames):
+    records = []
+    for filename in filenames:
+        with open(filename, 'r') as file:
+            records.extend(json.loads(line) for line in file if line.strip())
+    return records
+
+
+def report(records):
+    """Print the times per (metric, dimension, distance), summed over the jobs (or matrices), split into the phases,
+    with the time per pair of diagrams, the mean number of bars per diagram and the largest peak RSS."""
+    groups = defaultdict(list)
+    for record in records:
+        if record['record'] in ('job', 'matrix'):
+            groups[record['metric'], record['dimension'], record['distance']].append(record)
+
+    header = (f'{"metric":>10} {"dim":>3} {"distance":>22} {"jobs":>6} {"pairs":>7} {"cached":>6} {"total s":>9} '
+              + ' '.join(f'{phase + " s":>11}' for phase in PHASES) + f' {"ms/pair":>9} {"bars":>7} {"RSS MB":>8}')
+    print(header)
+    print('-' * len(header))
+    for (metric, dimension, distance), group in sorted(groups.items()):
+        phases = {phase: sum(record['phases'].get(phase, 0.0) for record in group) for phase in PHASES}
+        total = sum(phases.values())
+        pairs = sum(record['pairs'] for record in group)
+        cached = sum(record.get('cached', 0) for record in group)
+        bars = sum(record['bars'] for record in group) / max(sum(record['diagrams'] for record in group), 1)
+        print(f'{metric:>10} {dimension:>3} {distance:>22} {len(group):>6} {pairs:>7} {cached:>6} {total:>9.2f} '
+              + ' '.join(f'{phases[phase]:>11.2f}' for phase in PHASES)
+              + f' {1000 * total / max(pairs, 1):>9.3f} {bars:>7.0f}'
+              + f' {max(record["peak_rss_mb"] for record in group):>8.0f}')
+
+    tasks = [record for record in records if record['record'] == 'task']
+    if tasks:
+        durations = [record['seconds'] for record in tasks]
+        print()
+        print(f'{len(tasks)} tasks on {len({record["host"] for record in tasks})} hosts: '
+              f'{sum(durations):.1f} s in total, {min(durations):.1f}-{max(durations):.1f} s per task '
+              f'(mean {sum(durations) / len(durations):.1f} s), writing the parts '
+              f'{sum(record["phases"]["write"] for record in tasks):.1f} s, '
+              f'largest peak RSS {max(record["peak_rss_mb"] for record in tasks):.0f} MB')
+
+
+def init_args():
+    parser = argparse.ArgumentParser(
+        prog='Report the metrics of the persistence diagram distance computation')
+    parser.add_argument('files', type=str, nargs='+',
+                        help='The metrics files (.jsonl) written by the scripts with --log_metrics.')
+
+    return parser.parse_args()
+
+
+def main():
+    args = init_args()
+    report(read_records(args.files))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import functools
+
+import numpy as np
+import persim
+from scipy.spatial.distance import pdist, squareform
+from scipy.special import erfc
+
+
+def persistence_image_parameters(metric, dimension):
+    """Ranges, pixel size and kernel variance of the persistence images for the point-cloud metric and dimension."""
+    if metric == 'euclidean' and dimension == 0:
+        return {'birth_range': (0, 1), 'pers_range': (0, 10), 'pixel_size': 1, 'sigma': 1}
+    elif metric == 'euclidean' and dimension > 0:
+        return {'birth_range': (0, 10), 'pers_range': (0, 10), 'pixel_size': 1, 'sigma': 1}
+    elif metric == 'cosine' and dimension == 0:
+        return {'birth_range': (0, .1), 'pers_range': (0, 1), 'pixel_size': .1, 'sigma': .1}
+    elif metric == 'cosine' and dimension > 0:
+        return {'birth_range': (0, 1), 'pers_range': (0, 1), 'pixel_size': .1, 'sigma': .1}
+    else:  # Should not occur
+        raise ValueError('invalid metric-dimension combination for persistence_image distance [check code]')
+
+
+@functools.lru_cache(maxsize=None)
+def persistence_imager(birth_range, pers_range, pixel_size, sigma):
+    return persim.PersistenceImager(
+        birth_range=birth_range,
+        pers_range=pers_range,
+        pixel_size=pixel_size,
+        weight='persistence',
+        weight_params={},
+        kernel_params={'sigma': [[sigma, 0], [0, sigma]]}
+    )
+
+
+def norm_cdf_differences(values, corners, standard_deviation):
+    """For every value, the mass of the normal distribution centred at the value between consecutive pixel corners."""
+    cdf = erfc(-(corners[np.newaxis, :] - values[:, np.newaxis]) / standard_deviation / np.sqrt(2.0)) / 2.0
+    return np.diff(cdf, axis=1)
+
+
+def vectorise_persistence_images(pds, birth_range, pers_range, pixel_size, sigma):
+    """Persistence images (as persim.PersistenceImager with persistence weight and Gaussian kernel of variance sigma)
+    of all the diagrams at once, as an array of shape (#diagrams, #birth pixels, #persistence pixels).
+
+    The Gaussian kernel factorises into a birth and a persistence part, so the image of a diagram is the product
+    B^T diag(w) P of the (#bars, #pixels) matrices of the kernel masses of the pixels along both axes and the weights.
+    """
+    imager = persistence_imager(birth_range, pers_range, pixel_size, sigma)
+    bars = [np.asarray(pd, dtype='float64').reshape(-1, 2) for pd in pds]
+    points = np.concatenate(bars) if bars else np.empty((0, 2))
+    births = points[:, 0]
+    persistences = points[:, 1] - points[:, 0]
+    standard_deviation = np.sqrt(sigma)
+    # the pixel corners of the imager (its mesh is not exposed publicly)
+    birth_masses = norm_cdf_differences(births, imager._bpnts, standard_deviation) * persistences[:, np.newaxis]
+    persistence_masses = norm_cdf_differences(persistences, imager._ppnts, standard_deviation)
+    images = np.empty((len(bars),) + tuple(imager.resolution))
+    start = 0
+    for k, pd in enumerate(bars):
+        stop = start + len(pd)
+        images[k] = birth_masses[start:stop].T @ persistence_masses[start:stop]
+        start = stop
+    return images
+
+
+def vectorise_persistence_image(pd, birth_range, pers_range, pixel_size, sigma):
+    return vectorise_persistence_images([pd], birth_range, pers_range, pixel_size, sigma)[0]
+
+
+def persistence_landscape_parameters(metric, dimension):
+    """Grid and number of the persistence landscapes for the point-cloud metric and dimension: the grid covers the range
+    of the persistence images, from the smallest birth to the largest birth plus the largest persistence."""
+    image_parameters = persistence_image_parameters(metric, dimension)
+    return {'start': image_parameters['birth_range'][0],
+            'stop': image_parameters['birth_range'][1] + image_parameters['pers_range'][1],
+            'resolution': 1000,
+            'k': 5}
+
+
+def vectorise_persistence_landscapes(pds, start, stop, resolution, k, max_batch_elements=2 ** 24):
+    """The first k persistence landscapes of all the diagrams, sampled at the resolution points from start to stop,
+    as an array of shape (#diagrams, k, resolution). The values are scaled by the square root of the step of the grid,
+    so that the euclidean distance between the vectors approximates the L2 distance between the landscapes.
+
+    The diagrams are padded by empty bars into batches of at most max_batch_elements tent values
+    (#diagrams, #bars, resolution), and the k largest tents at every point are selected by one partition per batch.
+    """
+    grid = np.linspace(start, stop, resolution)
+    bars = [np.asarray(pd, dtype='float64').reshape(-1, 2) for pd in pds]
+    landscapes = np.zeros((len(bars), k, resolution))
+    first = 0
+    while first < len(bars):
+        last = first + 1
+        size = max(len(bars[first]), k)
+        while last < len(bars) and (last - first + 1) * max(size, len(bars[last])) * resolution <= max_batch_elements:
+            size = max(size, len(bars[last]))
+            last += 1
+        padded = np.zeros((last - first, size, 2))
+        for index, pd in enumerate(bars[first:last]):
+            padded[index, :len(pd)] = pd
+        tents = np.maximum(0, np.minimum(grid - padded[:, :, 0:1], padded[:, :, 1:2] - grid))
+        largest = np.partition(tents, size - k, axis=1)[:, size - k:]
+        landscapes[first:last] = np.sort(largest, axis=1)[:, ::-1]
+        first = last
+    step = (stop - start) / (resolution - 1) if resolution > 1 else 1
+    return landscapes * np.sqrt(step)
+
+
+def vectorise_persistence_landscape(pd, start, stop, resolution, k):
+    return vectorise_persistence_landscapes([pd], start, stop, resolution, k)[0]
+
+
+BARS_STATISTICS = ('mean', 'standard deviation', 'median', 'interquartile range', 'full range',
+                   '10th percentile', '25th percentile', '75th percentile', '90th percentile', 'entropy')
+
+
+def entropy(values):
+    """Entropy of the distribution proportional to the values along the last axis (0 where the values sum to 0)."""
+    total = np.sum(values, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy_not_normalized = np.sum(np.where(values > 0, values * np.log(np.where(values > 0, values, 1)), 0),
+                                        axis=-1)
+        return np.where(total > 0, np.log(total) - entropy_not_normalized / total, 0)
+
+
+def bars_quantities(pd, only_death=False):
+    """The (#quantities, #bars) array of the quantities of the bars: births, deaths, lifespans and midpoints
+    (in this order), or only the deaths. An empty diagram gives a single zero bar."""
+    pd = np.asarray(pd, dtype='float64').reshape(-1, 2)
+    if len(pd) == 0:
+        pd = np.zeros((1, 2), dtype='float64')
+    births, deaths = pd[:, 0], pd[:, 1]
+    if only_death:
+        return deaths[np.newaxis, :]
+    return np.stack([births, deaths, np.maximum(0, deaths - births), (births + deaths) / 2])
+
+
+def vectorise_bars_statistics(pd, only_death=False):
+    """Vector of the statistics BARS_STATISTICS of every quantity of the bars (see bars_quantities)."""
+    values = bars_quantities(pd, only_death=only_death)
+    percentiles = np.percentile(values, [10, 25, 75, 90], axis=1)
+    statistics = np.stack([
+        np.mean(values, axis=1),
+        np.std(values, axis=1),
+        np.median(values, axis=1),
+        percentiles[2] - percentiles[1],
+        np.ptp(values, axis=1),
+        percentiles[0],
+        percentiles[1],
+        percentiles[2],
+        percentiles[3],
+        entropy(values)
+    ], axis=1)
+    return statistics.ravel()
+
+
+def vectorise_bars_statistics_batch(pds, only_death=False):
+    """The (#diagrams, #features) matrix of the bars statistics of all the diagrams."""
+    return np.array([vectorise_bars_statistics(pd, only_death=only_death) for pd in pds])
+
+
+def vector_distance_matrix(vectors):
+    """Return the full matrix of the euclidean (Frobenius for images) distances between the vectors."""
+    return squareform(pdist(np.array([np.ravel(vector) for vector in vectors])))
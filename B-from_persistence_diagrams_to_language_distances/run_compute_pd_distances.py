@@ -2,11 +2,20 @@
 #   For the folders used, search for comments PATH TO DATA and PATH RO OUTPUT
 #
 
-import numpy as np
-import persim
 import time
-import gudhi
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from barcode_store import load_bars
+from pd_distance_cache import DistanceCache, diagram_hash, distance_key
+from pd_metrics import MetricsLog, PhaseTimer, peak_rss_mb
+from pd_distances import (APPROXIMATE_DISTANCES, PRUNED_DISTANCES, compare_pds_with_error, distance_parameters,
+                          prune_diagram, pruning_error, sliced_wasserstein_from_projections,
+                          sliced_wasserstein_projections)
+from pd_vectorisation import (persistence_image_parameters, persistence_landscape_parameters, vector_distance_matrix,
+                              vectorise_bars_statistics_batch, vectorise_persistence_images,
+                              vectorise_persistence_landscapes)
 
 
 def init_args():
@@ -28,27 +37,40 @@ def init_args():
                         help='List of the languages.')
     parser.add_argument('--task_id', type=int, required=False, default=-1,
                         help='If given, only perform one job, with the given id.')
+    parser.add_argument('--processes', '-p', type=int, required=False, default=1,
+                        help='Number of processes comparing the pairs of diagrams for bottleneck distance '
+                             '(default 1, 0 for the cores allocated to the task: SLURM_CPUS_PER_TASK if set, otherwise '
+                             'the CPU affinity of the process).')
+    parser.add_argument('--chunk_size', type=int, required=False, default=8,
+                        help='Number of pairs of diagrams sent to a process at once (default 8).')
+    parser.add_argument('--bottleneck_tolerance', type=float, required=False, default=0.0,
+                        help='Absolute error allowed for the bottleneck_tiered distance (default 0, i.e., exact).')
+    parser.add_argument('--bottleneck_approximation', type=float, required=False, default=None,
+                        help='Additive error of the approximate bottleneck computation tried by bottleneck_tiered '
+                             'before the exact one (default: the tolerance).')
+    parser.add_argument('--wasserstein_p', type=float, required=False, default=1,
+                        help='Order p of the wasserstein distance (default 1).')
+    parser.add_argument('--wasserstein_delta', type=float, required=False, default=0.01,
+                        help='Relative error of the wasserstein distance computed by gudhi.hera outside dimension 0, '
+                             'where it is exact (default 0.01, must be positive).')
+    parser.add_argument('--prune_persistence', type=float, required=False, default=0.0,
+                        help='Drop the bars with persistence below this before the bottleneck, sliced Wasserstein and '
+                             'wasserstein distances (default 0); the resulting bound on the change of the '
+                             'distances is added to their error bounds.')
+    parser.add_argument('--prune_top_k', type=int, required=False, default=None,
+                        help='Keep only the k most persistent bars of every diagram before the bottleneck, sliced '
+                             'Wasserstein and wasserstein distances (default: all); as --prune_persistence.')
+    parser.add_argument('--log_metrics', action='store_true',
+                        help='Write a JSON record per matrix (times of the phases, numbers of bars, peak RSS, host) to '
+                             'metrics.<name>.jsonl (metrics.<name>.part<task_id>.jsonl with --task_id) in the output '
+                             'folder; see pd_metrics.py for the report.')
+    parser.add_argument('--distance_cache', type=str, required=False, default=None,
+                        help='If given, the SQLite file of the persistent cache of distances between diagrams: '
+                             'distances found there are not computed again, new ones are added.')
 
     return parser.parse_args()
 
 
-def load_bars(filename):
-    bars = []
-    bars_dim = []
-    with open(filename, 'r') as file:
-        for row in file:
-            row = row.strip()
-            if len(row) == 0:
-                bars.append(np.array(bars_dim))
-            elif len(row) == 1:
-                bars_dim = []
-            else:
-                bars_dim.append(tuple(map(float, row.split())))
-        bars.append(np.array(bars_dim))
-
-    return bars
-
-
 def save_matrix(filename, mat, labels, line_sep='\n', decimal_places=6):
     with open(filename, 'w') as file:
         file.write(' '.join(labels) + line_sep)
@@ -56,63 +78,100 @@ def save_matrix(filename, mat, labels, line_sep='\n', decimal_places=6):
             file.write(' '.join([f'{x:.{decimal_places}f}' for x in row]) + line_sep)
 
 
-def vectorise_persistence_image(pd, birth_range, pers_range, pixel_size, sigma):
-    pi_transformer = persim.PersistenceImager(
-        birth_range=birth_range,
-        pers_range=pers_range,
-        pixel_size=pixel_size,
-        weight='persistence',
-        weight_params={},
-        kernel_params={'sigma': [[sigma, 0], [0, sigma]]}
-    )
+_worker_state = {}
 
-    return pi_transformer.transform([pd])[0]
 
+def available_cores():
+    """Number of cores the task may use: its Slurm allocation if set, otherwise the CPU affinity of the process
+    (not all the cores of a shared node)."""
+    if os.environ.get('SLURM_CPUS_PER_TASK'):
+        return int(os.environ['SLURM_CPUS_PER_TASK'])
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
 
-def entropy(values):
-    total = sum(values)
-    if total <= 0:
-        return 0
-    entropy_not_normalized = sum(x * np.log(x) for x in values if x > 0)
-    return np.log(sum(values)) - (entropy_not_normalized / sum(values))
 
+def init_worker(langs, n, maxdim, min_persistence=0.0, top_k=None):
+    _worker_state.update(langs=langs, n=n, maxdim=maxdim, min_persistence=min_persistence, top_k=top_k, pds={},
+                         pruned_pds={})
 
-def vectorise_bars_statistics(pd, only_death=False):
-    vector = []
-    if only_death:
-        quantities = {'deaths': lambda birth, death: death}
-    else:
-        quantities = {'deaths': lambda birth, death: death,
-                      'births': lambda birth, death: birth,
-                      'lifespans': lambda birth, death: max(0, death - birth),
-                      'midpoints': lambda birth, death: (birth + death) / 2}
-    for quantity_label, quantity in sorted(quantities.items()):
-        values = np.fromiter((quantity(birth, death) for birth, death in pd), dtype='float64')
-        if len(values) == 0:
-            values = np.zeros(1, dtype='float64')
-        statistics = {
-            'mean': np.mean(values),
-            'standard deviation': np.std(values),
-            'median': np.median(values),
-            'interquartile range': np.subtract(*np.percentile(values, [75, 25])),
-            'full range': np.ptp(values),
-            '10th percentile': np.percentile(values, 10),
-            '25th percentile': np.percentile(values, 25),
-            '75th percentile': np.percentile(values, 75),
-            '90th percentile': np.percentile(values, 90),
-            'entropy': entropy(values)
-        }
-        for statistic_label in ['mean', 'standard deviation', 'median', 'interquartile range', 'full range',
-                                '10th percentile', '25th percentile', '75th percentile', '90th percentile', 'entropy']:
-            vector.append(statistics[statistic_label])
-    return np.array(vector)
-
-
-def compare_pds(pd1, pd2, distance):
-    if distance == 'bottleneck':
-        return gudhi.bottleneck_distance(pd1, pd2)  # third argument leads to approximating
+
+def worker_diagram(lang, metric, dim):
+    """The pruned diagram (the processes only compute the distances in PRUNED_DISTANCES)."""
+    # the bars are memory-mapped from the barcode store, so the processes share them through the page cache
+    pds = _worker_state['pds']
+    pruned_pds = _worker_state['pruned_pds']
+    if (lang, metric) not in pds:
+        pds[lang, metric] = load_bars(lang, _worker_state['n'], metric, _worker_state['maxdim'],
+                                      bars_folder='data/bars')  # PATH TO DATA
+    if (lang, metric, dim) not in pruned_pds:
+        pruned_pds[lang, metric, dim] = prune_diagram(pds[lang, metric][dim], _worker_state['min_persistence'],
+                                                      _worker_state['top_k'])[0]
+    return pruned_pds[lang, metric, dim]
+
+
+def compare_pairs(metric, dim, distance, parameters, pairs):
+    """The distances of the pairs and the peak RSS of the worker process."""
+    langs = _worker_state['langs']
+    values = [(i, j, compare_pds_with_error(worker_diagram(langs[i], metric, dim), worker_diagram(langs[j], metric, dim),
+                                            distance, **parameters))
+              for i, j in pairs]
+    return values, peak_rss_mb()
+
+
+def compare_all_pairs(pds, langs, dim, distance, pairs, parameters, executor=None, metric=None, chunk_size=8,
+                      timer=None):
+    """Return the dictionary (i, j) -> (distance, error bound) between the diagrams of the languages i and j.
+
+    With an executor, the pairs are sent to the processes in chunks, the most expensive pairs (by the product of
+    the numbers of bars) first, so that the slow pairs do not straggle at the end. The peak RSS of the processes is
+    added to the timer, if given.
+    """
+    if executor is None:
+        return {(i, j): compare_pds_with_error(pds[langs[i]][dim], pds[langs[j]][dim], distance, **parameters)
+                for i, j in pairs}
+    pairs = sorted(pairs, key=lambda pair: len(pds[langs[pair[0]]][dim]) * len(pds[langs[pair[1]]][dim]), reverse=True)
+    futures = [executor.submit(compare_pairs, metric, dim, distance, parameters, pairs[k:k + chunk_size])
+               for k in range(0, len(pairs), chunk_size)]
+    values = {}
+    for future in futures:
+        chunk_values, worker_peak_rss_mb = future.result()
+        values.update({(i, j): value for i, j, value in chunk_values})
+        if timer is not None:
+            timer.add_worker_peak_rss(worker_peak_rss_mb)
+    return values
+
+
+def pair_distances(pds, langs, metric, dim, distance, pairs, parameters, executor=None, chunk_size=8, timer=None):
+    """Return the dictionary (i, j) -> (distance, error bound) between the diagrams of the languages i and j;
+    the times of the vectorisation and the comparison are added to the timer, if given."""
+    timer = PhaseTimer() if timer is None else timer
+    if distance == 'persistence_image':
+        with timer.phase('vectorise'):
+            vectors = vectorise_persistence_images([pds[lang][dim] for lang in langs],
+                                                   **persistence_image_parameters(metric, dim))
+    elif distance == 'persistence_landscape':
+        # the landscapes of all the diagrams on the same grid, in one pass
+        with timer.phase('vectorise'):
+            vectors = vectorise_persistence_landscapes([pds[lang][dim] for lang in langs],
+                                                       **persistence_landscape_parameters(metric, dim))
+    elif distance == 'bars_statistics':
+        with timer.phase('vectorise'):
+            vectors = vectorise_bars_statistics_batch([pds[lang][dim] for lang in langs], only_death=dim == 0)
     elif distance == 'sliced_wasserstein':
-        return persim.sliced_wasserstein(pd1, pd2, M=50)
+        # every diagram is projected and sorted once, the pairs only merge the sorted projections
+        with timer.phase('vectorise'):
+            projections = {i: sliced_wasserstein_projections(pds[langs[i]][dim], M=50) for pair in pairs for i in pair}
+        with timer.phase('compare'):
+            return {(i, j): (sliced_wasserstein_from_projections(projections[i], projections[j]), 0.0)
+                    for i, j in pairs}
+    else:
+        with timer.phase('compare'):
+            return compare_all_pairs(pds, langs, dim, distance, pairs, parameters, executor=executor, metric=metric,
+                                     chunk_size=chunk_size, timer=timer)
+    with timer.phase('compare'):
+        matrix = vector_distance_matrix(vectors)
+    return {(i, j): (matrix[i, j], 0.0) for i, j in pairs}
 
 
 def main():
@@ -136,50 +195,91 @@ def main():
     else:
         parameter_indices = range(len(parameter_list))
 
+    processes = args.processes if args.processes > 0 else available_cores()
+    executor = None
+    if processes > 1 and any(parameter_list[k][2] in ('bottleneck', 'bottleneck_tiered', 'wasserstein')
+                             for k in parameter_indices):
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                                       initargs=(langs, n, maxdim, args.prune_persistence, args.prune_top_k))
+
+    distance_cache = DistanceCache(args.distance_cache) if args.distance_cache else None
+    metrics_log = None
+    if args.log_metrics:
+        # one file per task of a Slurm array, as the distributed script
+        metrics_filename = (f'{out_folder}/metrics.{experiment_name}.jsonl' if args.task_id < 0  # PATH TO OUTPUT
+                            else f'{out_folder}/metrics.{experiment_name}.part{args.task_id:05d}.jsonl')
+        metrics_log = MetricsLog(metrics_filename, experiment_name=experiment_name, task_id=args.task_id)
+    pds_by_metric = {}
     for parameter_index in parameter_indices:
         metric, dim, distance = parameter_list[parameter_index]
-
-        pds = {lang: load_bars(f'data/bars/bars.{lang}.300.n{n}.{metric}.d{maxdim}.txt') for lang in langs}  # PATH TO DATA
         print(f'Computing matrix for {metric} metric, with {distance} distance, dimension {dim}')
         ts = time.perf_counter()
+        timer = PhaseTimer()
 
-        if distance == 'persistence_image':
-            if metric == 'euclidean' and dim == 0:
-                pds_vec = {
-                    lang: vectorise_persistence_image(pd[dim], birth_range=(0, 1), pers_range=(0, 10), pixel_size=1,
-                                                      sigma=1) for lang, pd in pds.items()}
-            elif metric == 'euclidean' and dim > 0:
-                pds_vec = {
-                    lang: vectorise_persistence_image(pd[dim], birth_range=(0, 10), pers_range=(0, 10), pixel_size=1,
-                                                      sigma=1) for lang, pd in pds.items()}
-            elif metric == 'cosine' and dim == 0:
-                pds_vec = {
-                    lang: vectorise_persistence_image(pd[dim], birth_range=(0, .1), pers_range=(0, 1), pixel_size=.1,
-                                                      sigma=.1) for lang, pd in pds.items()}
-            elif metric == 'cosine' and dim > 0:
-                pds_vec = {
-                    lang: vectorise_persistence_image(pd[dim], birth_range=(0, 1), pers_range=(0, 1), pixel_size=.1,
-                                                      sigma=.1) for lang, pd in pds.items()}
-            else:  # Should not occur
-                raise ValueError('invalid metric-dimension combination for persistence_image distance [check code]')
-
-        if distance == 'bars_statistics':
-            pds_vec = {lang: vectorise_bars_statistics(pd[dim], only_death=True if dim == 0 else False) for lang, pd in
-                       pds.items()}
-
-        distances_lower_triangular_matrix = []
-        for i in range(1, len(langs)):
-            row = []
-            for j in range(i):
-                if distance in ('bottleneck', 'sliced_wasserstein'):
-                    row.append(compare_pds(pds[langs[i]][dim], pds[langs[j]][dim], distance))
-                else:
-                    row.append(np.linalg.norm(pds_vec[langs[i]] - pds_vec[langs[j]]))
-            distances_lower_triangular_matrix.append(row)
+        with timer.phase('load'):
+            if metric not in pds_by_metric:
+                pds_by_metric[metric] = {lang: load_bars(lang, n, metric, maxdim, bars_folder='data/bars')  # PATH TO DATA
+                                         for lang in langs}
+            pds = pds_by_metric[metric]
+            pruning = distance in PRUNED_DISTANCES and (args.prune_persistence > 0 or args.prune_top_k is not None)
+            if distance in PRUNED_DISTANCES:
+                pruned = {lang: prune_diagram(pds[lang][dim], args.prune_persistence, args.prune_top_k)
+                          for lang in langs}
+                pds = {lang: {dim: pruned[lang][0]} for lang in langs}
+
+        pairs = [(i, j) for i in range(1, len(langs)) for j in range(i)]
+        parameters = distance_parameters(metric, dim, distance, bottleneck_tolerance=args.bottleneck_tolerance,
+                                         bottleneck_approximation=args.bottleneck_approximation,
+                                         wasserstein_p=args.wasserstein_p, wasserstein_delta=args.wasserstein_delta)
+        cached = 0
+        if distance_cache is not None:
+            with timer.phase('load'):
+                hashes = [diagram_hash(pds[lang][dim]) for lang in langs]
+                keys = {(i, j): distance_key(hashes[i], hashes[j], distance, parameters) for i, j in pairs}
+                cached_values = distance_cache.get_many(keys.values())
+                values = {pair: cached_values[key] for pair, key in keys.items() if key in cached_values}
+            computed_values = pair_distances(pds, langs, metric, dim, distance,
+                                             [pair for pair in pairs if pair not in values], parameters,
+                                             executor=executor, chunk_size=args.chunk_size, timer=timer)
+            with timer.phase('write'):
+                distance_cache.put_many({keys[pair]: value for pair, value in computed_values.items()})
+            print(f'{len(values)} distances from the cache, {len(computed_values)} computed')
+            cached = len(values)
+            values.update(computed_values)
+        else:
+            values = pair_distances(pds, langs, metric, dim, distance, pairs, parameters, executor=executor,
+                                    chunk_size=args.chunk_size, timer=timer)
+        if pruning:
+            # the distances are between the pruned diagrams, add the bound of the pruning to the error bounds
+            values = {(i, j): (value, error + pruning_error(distance, pruned[langs[i]][1], pruned[langs[j]][1],
+                                                            **parameters))
+                      for (i, j), (value, error) in values.items()}
+            print(f'Bars kept after pruning: {sum(len(pds[lang][dim]) for lang in langs)} of '
+                  f'{sum(len(pds[lang][dim]) + len(pruned[lang][1]) for lang in langs)}')
+        distances_lower_triangular_matrix = [[values[i, j][0] for j in range(i)] for i in range(1, len(langs))]
         filename = f'{out_folder}/pddmat.{experiment_name}.n{n}.{metric}.{distance}.d{dim}.txt'  # PATH TO OUTPUT
-        save_matrix(filename, distances_lower_triangular_matrix, langs)
+        with timer.phase('write'):
+            save_matrix(filename, distances_lower_triangular_matrix, langs)
+        if distance in APPROXIMATE_DISTANCES or pruning:
+            errors_lower_triangular_matrix = [[values[i, j][1] for j in range(i)] for i in range(1, len(langs))]
+            error_filename = f'{out_folder}/pddmat.{experiment_name}.n{n}.{metric}.{distance}.d{dim}.error.txt'  # PATH TO OUTPUT
+            with timer.phase('write'):
+                save_matrix(error_filename, errors_lower_triangular_matrix, langs)
+            print(f'Largest error bound: {max(error for row in errors_lower_triangular_matrix for error in row):.6f}, '
+                  f'error bounds saved to: {error_filename}')
         print(f'Time: {time.perf_counter() - ts:.1f} s, matrix saved to: {filename}')
         print()
+        if metrics_log is not None:
+            metrics_log.write('matrix', timer, metric=metric, dimension=dim, distance=distance, pairs=len(pairs),
+                              diagrams=len(langs), bars=sum(len(pds[lang][dim]) for lang in langs), cached=cached,
+                              processes=processes)
+
+    if executor is not None:
+        executor.shutdown()
+    if distance_cache is not None:
+        distance_cache.close()
+    if metrics_log is not None:
+        metrics_log.close()
 
 
 if __name__ == '__main__':
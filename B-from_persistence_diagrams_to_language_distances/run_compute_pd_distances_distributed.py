@@ -3,13 +3,21 @@
 #
 
 import numpy as np
-import persim
 import time
-import gudhi
 import argparse
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from barcode_store import load_bars
+from diagram_cache import LRUCache
+from distance_parts import COLUMNS, save_part_json, save_part_npz
+from job_scheduling import job_id_to_parameter_indices, task_schedule
+from pd_distance_cache import DistanceCache, diagram_hash, distance_key
+from pd_metrics import MetricsLog, PhaseTimer
+from pd_distances import (PRUNED_DISTANCES, compare_pds_with_error, distance_parameters, prune_diagram, pruning_error,
+                          sliced_wasserstein_from_projections, sliced_wasserstein_projections)
+from pd_vectorisation import vectorise_bars_statistics, vectorise_persistence_image, vectorise_persistence_landscape
+
 
 def init_args():
     parser = argparse.ArgumentParser(
@@ -31,134 +39,133 @@ def init_args():
                         help='List of the point-cloud metrics used.')
     parser.add_argument('--languages', type=str, nargs='+', required=True,
                         help='List of the languages.')
-    parser.add_argument('--task_id', type=int, required=True,
+    parser.add_argument('--task_id', type=int, required=False, default=-1,
                         help='Based on the task_id, a batch of jobs (distances) is computed.')
     parser.add_argument('--batch_size', type=int, required=False, default=100,
                         help='Size of one batch')
+    parser.add_argument('--number_of_tasks', type=int, required=False, default=0,
+                        help='If given, the jobs are split into this many tasks of balanced estimated cost (from the '
+                             'numbers of bars and the distances) instead of consecutive batches of --batch_size jobs.')
+    parser.add_argument('--local_processes', type=int, required=False, default=0,
+                        help='If given, all the tasks are run on this machine by this many processes '
+                             '(instead of one task given by --task_id).')
+    parser.add_argument('--bottleneck_tolerance', type=float, required=False, default=0.0,
+                        help='Absolute error allowed for the bottleneck_tiered distance (default 0, i.e., exact).')
+    parser.add_argument('--bottleneck_approximation', type=float, required=False, default=None,
+                        help='Additive error of the approximate bottleneck computation tried by bottleneck_tiered '
+                             'before the exact one (default: the tolerance).')
+    parser.add_argument('--wasserstein_p', type=float, required=False, default=1,
+                        help='Order p of the wasserstein distance (default 1).')
+    parser.add_argument('--wasserstein_delta', type=float, required=False, default=0.01,
+                        help='Relative error of the wasserstein distance computed by gudhi.hera outside dimension 0, '
+                             'where it is exact (default 0.01, must be positive).')
+    parser.add_argument('--prune_persistence', type=float, required=False, default=0.0,
+                        help='Drop the bars with persistence below this before the bottleneck, sliced Wasserstein and '
+                             'wasserstein distances (default 0); the resulting bound on the change of the '
+                             'distances is added to their error bounds.')
+    parser.add_argument('--prune_top_k', type=int, required=False, default=None,
+                        help='Keep only the k most persistent bars of every diagram before the bottleneck, sliced '
+                             'Wasserstein and wasserstein distances (default: all); as --prune_persistence.')
+    parser.add_argument('--output_format', type=str, required=False, default='npz', choices=('npz', 'json'),
+                        help='Format of the part files: npz (columns of job ids, indices and values, default) '
+                             'or json (one dictionary per distance).')
+    parser.add_argument('--distance_cache', type=str, required=False, default=None,
+                        help='If given, the SQLite file of the persistent cache of distances between diagrams: '
+                             'distances found there are not computed again, new ones are added.')
+    parser.add_argument('--cache_mb', type=float, required=False, default=1024,
+                        help='Memory bound of the per-process cache of diagrams and their vectorisations, in MB '
+                             '(default 1024)')
+    parser.add_argument('--log_metrics', action='store_true',
+                        help='Write a JSON record per job (times of the phases, numbers of bars, peak RSS, host) to '
+                             'metrics.<name>.part<task_id>.jsonl in the output folder; see pd_metrics.py for the report.')
 
     return parser.parse_args()
 
 
-def pair_to_number(i, j):
-    return i * (i - 1) // 2 + j
-
-
-def number_to_pair(index):
-    i = int((1 + (1 + 8 * index) ** (1 / 2)) / 2)
-    j = index - (i * (i - 1) // 2)
-    return i, j
-
-
-def job_id_to_parameter_indices(job_id, number_of_parameters, number_of_languages):
-    k = job_id % number_of_parameters
-    number = job_id // number_of_parameters
-    i, j = number_to_pair(number)
-    return k, (i, j)
-
-
-def load_bars(filename):
-    bars = []
-    bars_dim = []
-    with open(filename, 'r') as file:
-        for row in file:
-            row = row.strip()
-            if len(row) == 0:
-                bars.append(np.array(bars_dim))
-            elif len(row) == 1:
-                bars_dim = []
-            else:
-                bars_dim.append(tuple(map(float, row.split())))
-        bars.append(np.array(bars_dim))
-
-    return bars
-
-
-def vectorise_persistence_image(pd, birth_range, pers_range, pixel_size, sigma):
-    pi_transformer = persim.PersistenceImager(
-        birth_range=birth_range,
-        pers_range=pers_range,
-        pixel_size=pixel_size,
-        weight='persistence',
-        weight_params={},
-        kernel_params={'sigma': [[sigma, 0], [0, sigma]]}
-    )
-
-    return pi_transformer.transform([pd])[0]
-
-
-def entropy(values):
-    total = sum(values)
-    if total <= 0:
-        return 0
-    entropy_not_normalized = sum(x * np.log(x) for x in values if x > 0)
-    return np.log(sum(values)) - (entropy_not_normalized / sum(values))
-
-
-def vectorise_bars_statistics(pd, only_death=False):
-    vector = []
-    if only_death:
-        quantities = {'deaths': lambda birth, death: death}
+def vectorise(pd, distance, parameters):
+    if distance == 'persistence_image':
+        return vectorise_persistence_image(pd, **parameters)
+    if distance == 'persistence_landscape':
+        return vectorise_persistence_landscape(pd, **parameters)
+    if distance == 'bars_statistics':
+        return vectorise_bars_statistics(pd, **parameters)
+    if distance == 'sliced_wasserstein':
+        return sliced_wasserstein_projections(pd, **parameters)
+
+
+class DiagramCache:
+    """Per-process cache of the diagrams, their pruned versions and their vectorisations, so that a batch of jobs
+    loads and vectorises every (language, metric, dimension) only once. The distances in PRUNED_DISTANCES use
+    the pruned diagrams (which are the diagrams themselves, if there is no pruning)."""
+
+    def __init__(self, n, maxdim, max_bytes, min_persistence=0.0, top_k=None):
+        self.n = n
+        self.maxdim = maxdim
+        self.min_persistence = min_persistence
+        self.top_k = top_k
+        self.cache = LRUCache(max_bytes)
+
+    def diagram(self, language, metric, dimension):
+        return self.cache.get(
+            ('diagram', language, metric, dimension),
+            lambda: np.array(load_bars(language, self.n, metric, self.maxdim, bars_folder='data/bars')[dimension]))  # PATH TO DATA
+
+    def pruned(self, language, metric, dimension):
+        """The pruned diagram and the persistences of its dropped bars."""
+        return self.cache.get(
+            ('pruned', language, metric, dimension),
+            lambda: prune_diagram(self.diagram(language, metric, dimension), self.min_persistence, self.top_k))
+
+    def diagram_of(self, language, metric, dimension, distance):
+        if distance in PRUNED_DISTANCES:
+            return self.pruned(language, metric, dimension)[0]
+        return self.diagram(language, metric, dimension)
+
+    def hash(self, language, metric, dimension, distance):
+        return self.cache.get(('hash', language, metric, dimension, distance in PRUNED_DISTANCES),
+                              lambda: diagram_hash(self.diagram_of(language, metric, dimension, distance)))
+
+    def vectorisation(self, language, metric, dimension, distance):
+        parameters = distance_parameters(metric, dimension, distance)
+        return self.cache.get(
+            ('vectorisation', language, metric, dimension, distance, tuple(sorted(parameters.items()))),
+            lambda: vectorise(self.diagram_of(language, metric, dimension, distance), distance, parameters))
+
+
+def compute_distance(cache, language_1, language_2, metric, dimension, distance, parameters):
+    """Return the distance between the diagrams of the languages and a bound on its error."""
+    if distance == 'sliced_wasserstein':
+        return sliced_wasserstein_from_projections(cache.vectorisation(language_1, metric, dimension, distance),
+                                                   cache.vectorisation(language_2, metric, dimension, distance)), 0.0
+    elif distance in ('bottleneck', 'bottleneck_tiered', 'wasserstein'):
+        return compare_pds_with_error(cache.diagram_of(language_1, metric, dimension, distance),
+                                      cache.diagram_of(language_2, metric, dimension, distance), distance, **parameters)
     else:
-        quantities = {'deaths': lambda birth, death: death,
-                      'births': lambda birth, death: birth,
-                      'lifespans': lambda birth, death: max(0, death - birth),
-                      'midpoints': lambda birth, death: (birth + death) / 2}
-    for quantity_label, quantity in sorted(quantities.items()):
-        values = np.fromiter((quantity(birth, death) for birth, death in pd), dtype='float64')
-        if len(values) == 0:
-            values = np.zeros(1, dtype='float64')
-        statistics = {
-            'mean': np.mean(values),
-            'standard deviation': np.std(values),
-            'median': np.median(values),
-            'interquartile range': np.subtract(*np.percentile(values, [75, 25])),
-            'full range': np.ptp(values),
-            '10th percentile': np.percentile(values, 10),
-            '25th percentile': np.percentile(values, 25),
-            '75th percentile': np.percentile(values, 75),
-            '90th percentile': np.percentile(values, 90),
-            'entropy': entropy(values)
-        }
-        for statistic_label in ['mean', 'standard deviation', 'median', 'interquartile range', 'full range',
-                                '10th percentile', '25th percentile', '75th percentile', '90th percentile', 'entropy']:
-            vector.append(statistics[statistic_label])
-    return np.array(vector)
-
-
-def compare_pds(pd1, pd2, distance):
-    if distance == 'bottleneck':
-        return gudhi.bottleneck_distance(pd1, pd2)  # third argument leads to approximating
-    elif distance == 'sliced_wasserstein':
-        return persim.sliced_wasserstein(pd1, pd2, M=50)
+        return np.linalg.norm(cache.vectorisation(language_1, metric, dimension, distance)
+                              - cache.vectorisation(language_2, metric, dimension, distance)), 0.0
 
 
-def main():
-    print("=== Script started: Compute pd distances distributed ===")
-    args = init_args()
+def run_task(args, parameters, maxdim, task_id, job_ids):
     experiment_name = args.name
     out_folder = Path(args.output_folder)
     n = args.number
-
     languages = args.languages
 
-    metrics = args.metrics
-    dimensions = args.dimensions
-    maxdim = args.maxdim if args.maxdim > -1 else max(dimensions)
-    distances = args.distances
-    parameters = [(metric, dimension, distance) for metric in metrics for dimension in dimensions for distance in
-                  distances]
-    number_of_jobs = len(parameters) * len(languages) * (len(languages) - 1) // 2
-
-    task_id = args.task_id
-    batch_size = args.batch_size
-
-    print(
-        f"Experiment {experiment_name}: words={n}, #langs={len(languages)}, maxdim={maxdim}, task_id={task_id} --> jobs {task_id * batch_size}-{min((task_id + 1) * batch_size, number_of_jobs)}")
-
-    results = []
+    print(f"Experiment {experiment_name}: words={n}, #langs={len(languages)}, maxdim={maxdim}, task_id={task_id} --> "
+          f"{len(job_ids)} jobs" + (f" {job_ids[0]}-{job_ids[-1] + 1}" if job_ids else ""))
+
+    cache = DiagramCache(n, maxdim, max_bytes=args.cache_mb * 2 ** 20, min_persistence=args.prune_persistence,
+                         top_k=args.prune_top_k)
+    distance_cache = DistanceCache(args.distance_cache) if args.distance_cache else None
+    metrics_log = None
+    if args.log_metrics:
+        metrics_log = MetricsLog(out_folder / f'metrics.{experiment_name}.part{task_id:05d}.jsonl',  # PATH TO OUTPUT
+                                 experiment_name=experiment_name, task_id=task_id)
+    computed_distances = {}
+    columns = {column: [] for column in COLUMNS}
+    job_records = []
     ts_all = time.perf_counter()
-    for job_id in range(task_id * batch_size, min((task_id + 1) * batch_size, number_of_jobs)):
-
+    for job_id in job_ids:
         k, (i, j) = job_id_to_parameter_indices(job_id, len(parameters), len(languages))
         metric, dimension, distance = parameters[k]
         language_1 = languages[i]
@@ -166,54 +173,94 @@ def main():
 
         print(f"    job {job_id : 6d}: {metric}, {dimension}, {distance} for {language_1} vs {language_2} ... ", end="")
 
-        pds = {lang: load_bars(f'data/bars/bars.{lang}.300.n{n}.{metric}.d{maxdim}.txt') for lang in  # PATH TO DATA
-               [language_1, language_2]}
         ts = time.perf_counter()
-
-        if distance == 'persistence_image':
-            if metric == 'euclidean' and dimension == 0:
-                pds_vec = {lang: vectorise_persistence_image(pd[dimension], birth_range=(0, 1), pers_range=(0, 10),
-                                                             pixel_size=1, sigma=1) for lang, pd in pds.items()}
-            elif metric == 'euclidean' and dimension > 0:
-                pds_vec = {lang: vectorise_persistence_image(pd[dimension], birth_range=(0, 10), pers_range=(0, 10),
-                                                             pixel_size=1, sigma=1) for lang, pd in pds.items()}
-            elif metric == 'cosine' and dimension == 0:
-                pds_vec = {lang: vectorise_persistence_image(pd[dimension], birth_range=(0, .1), pers_range=(0, 1),
-                                                             pixel_size=.1, sigma=.1) for lang, pd in pds.items()}
-            elif metric == 'cosine' and dimension > 0:
-                pds_vec = {lang: vectorise_persistence_image(pd[dimension], birth_range=(0, 1), pers_range=(0, 1),
-                                                             pixel_size=.1, sigma=.1) for lang, pd in pds.items()}
-            else:  # Should not occur
-                raise ValueError('invalid metric-dimension combination for persistence_image distance [check code]')
-
-        if distance == 'bars_statistics':
-            pds_vec = {lang: vectorise_bars_statistics(pd[dimension], only_death=True if dimension == 0 else False) for
-                       lang, pd in pds.items()}
-
-        if distance in ('bottleneck', 'sliced_wasserstein'):
-            value = compare_pds(pds[language_1][dimension], pds[language_2][dimension], distance)
+        timer = PhaseTimer()
+
+        parameters_of_distance = distance_parameters(metric, dimension, distance,
+                                                     bottleneck_tolerance=args.bottleneck_tolerance,
+                                                     bottleneck_approximation=args.bottleneck_approximation,
+                                                     wasserstein_p=args.wasserstein_p,
+                                                     wasserstein_delta=args.wasserstein_delta)
+        key = cached = None
+        with timer.phase('load'):
+            pd_1 = cache.diagram_of(language_1, metric, dimension, distance)
+            pd_2 = cache.diagram_of(language_2, metric, dimension, distance)
+            if distance_cache is not None:
+                key = distance_key(cache.hash(language_1, metric, dimension, distance),
+                                   cache.hash(language_2, metric, dimension, distance),
+                                   distance, parameters_of_distance)
+                cached = distance_cache.get(key)
+
+        if cached is not None:
+            print('(cached) ', end='')
+            value, error = cached
         else:
-            value = np.linalg.norm(pds_vec[language_1] - pds_vec[language_2])
-
-        results.append({
-            'experiment_name': experiment_name,
-            'words': n,
-            'embedding_dimension': 300,
-            'job_id': job_id,
-            'metric': metric,
-            'persistent_diagram_dim': dimension,
-            'pd_metric': distance,
-            'languages': sorted([language_1, language_2]),
-            'value': value
-        })
+            if distance in ('persistence_image', 'persistence_landscape', 'bars_statistics', 'sliced_wasserstein'):
+                with timer.phase('vectorise'):
+                    cache.vectorisation(language_1, metric, dimension, distance)
+                    cache.vectorisation(language_2, metric, dimension, distance)
+            with timer.phase('compare'):
+                value, error = compute_distance(cache, language_1, language_2, metric, dimension, distance,
+                                                parameters_of_distance)
+            if key is not None:
+                computed_distances[key] = (value, error)
+
+        if distance in PRUNED_DISTANCES:
+            # the distance is between the pruned diagrams, add the bound of the pruning to the error bound
+            error += pruning_error(distance, cache.pruned(language_1, metric, dimension)[1],
+                                   cache.pruned(language_2, metric, dimension)[1], **parameters_of_distance)
+
+        for column, entry in zip(COLUMNS, (job_id, k, i, j, value, error)):
+            columns[column].append(entry)
 
         print(f'{time.perf_counter() - ts : .3f} s')
-
-    filename = out_folder / f'distances.{experiment_name}.part{task_id:05d}.json'  # PATH TO OUTPUT
-    with open(filename, 'w') as file:
-        json.dump(results, file)
+        job_records.append((timer, dict(job_id=job_id, metric=metric, dimension=dimension, distance=distance,
+                                        languages=[language_1, language_2], pairs=1, diagrams=2,
+                                        bars=len(pd_1) + len(pd_2), cached=cached is not None)))
+
+    task_timer = PhaseTimer()
+    filename = out_folder / f'distances.{experiment_name}.part{task_id:05d}.{args.output_format}'  # PATH TO OUTPUT
+    save_part = save_part_npz if args.output_format == 'npz' else save_part_json
+    with task_timer.phase('write'):
+        save_part(filename, experiment_name, n, parameters, languages, columns)
+
+    if distance_cache is not None:
+        with task_timer.phase('write'):
+            distance_cache.put_many(computed_distances)
+            distance_cache.close()
+        print(f'Added {len(computed_distances)} distances to the distance cache {args.distance_cache}')
 
     print(f'Time: {time.perf_counter() - ts_all : .3f} s, distances saved to: {filename}')
+    print(f'Diagram {cache.cache.statistics()}')
+    if metrics_log is not None:
+        # the part and the distance cache are written once per task, every job gets a share of the time
+        for timer, fields in job_records:
+            timer.phases['write'] = task_timer.phases['write'] / len(job_records)
+            metrics_log.write('job', timer, **fields)
+        metrics_log.write('task', task_timer, jobs=len(job_ids), seconds=time.perf_counter() - ts_all)
+        metrics_log.close()
+
+
+def main():
+    print("=== Script started: Compute pd distances distributed ===")
+    args = init_args()
+    languages = args.languages
+    maxdim = args.maxdim if args.maxdim > -1 else max(args.dimensions)
+    parameters = [(metric, dimension, distance) for metric in args.metrics for dimension in args.dimensions
+                  for distance in args.distances]
+
+    tasks = task_schedule(parameters, languages, args.number, maxdim, batch_size=args.batch_size,
+                          number_of_tasks=args.number_of_tasks)
+    if args.local_processes > 0:
+        with ProcessPoolExecutor(max_workers=args.local_processes) as executor:
+            futures = [executor.submit(run_task, args, parameters, maxdim, task_id, job_ids)
+                       for task_id, job_ids in enumerate(tasks)]
+            for future in futures:
+                future.result()
+    elif args.task_id >= 0:
+        run_task(args, parameters, maxdim, args.task_id, tasks[args.task_id] if args.task_id < len(tasks) else [])
+    else:
+        raise ValueError('Either --task_id or --local_processes must be given.')
 
 
 if __name__ == '__main__':
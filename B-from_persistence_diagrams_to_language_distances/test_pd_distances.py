@@ -0,0 +1,118 @@
+#
+#   Tests of the distances of pd_distances.py and their error bounds against brute-force matchings and gudhi:
+#       python3 -m pytest test_pd_distances.py
+#
+
+import gudhi
+import gudhi.hera
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from pd_distances import (bottleneck_dimension_0, bottleneck_exact, bottleneck_tiered, compare_pds_with_error,
+                          distance_parameters, prune_diagram, pruning_error, wasserstein_dimension_0)
+
+
+def matching_costs(pd1, pd2, p=1):
+    """Costs of the assignment problem between the bars (L-infinity distances) and the diagonal copies of the bars of
+    the other diagram (half the persistences)."""
+    n, m = len(pd1), len(pd2)
+    costs = np.full((n + m, m + n), np.inf)
+    costs[:n, :m] = np.max(np.abs(pd1[:, np.newaxis, :] - pd2[np.newaxis, :, :]), axis=2) ** p
+    costs[np.arange(n), m + np.arange(n)] = ((pd1[:, 1] - pd1[:, 0]) / 2) ** p
+    costs[n + np.arange(m), np.arange(m)] = ((pd2[:, 1] - pd2[:, 0]) / 2) ** p
+    costs[n:, m:] = 0
+    return costs
+
+
+def brute_force_wasserstein(pd1, pd2, p=1):
+    costs = matching_costs(pd1, pd2, p)
+    rows, columns = linear_sum_assignment(np.where(np.isfinite(costs), costs, 1e18))
+    return costs[rows, columns].sum() ** (1 / p)
+
+
+def brute_force_bottleneck(pd1, pd2):
+    """The smallest cost such that the edges up to it contain a perfect matching."""
+    costs = matching_costs(pd1, pd2)
+    for candidate in np.unique(costs[np.isfinite(costs)]):
+        rows, columns = linear_sum_assignment(costs > candidate)
+        if not np.any((costs > candidate)[rows, columns]):
+            return candidate
+    return 0.0
+
+
+def random_deaths(rng, size, ties):
+    return rng.choice([0.5, 1.0, 1.5, 2.0, 3.0], size) if ties else rng.exponential(1.0, size)
+
+
+def diagram(deaths):
+    return np.column_stack([np.zeros(len(deaths)), deaths])
+
+
+def random_diagram(rng, size):
+    births = rng.uniform(0, 2, size)
+    return np.column_stack([births, births + rng.exponential(0.5, size)])
+
+
+@pytest.mark.parametrize('ties', [False, True])
+def test_dimension_0_against_brute_force(ties):
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        deaths1, deaths2 = random_deaths(rng, rng.integers(0, 9), ties), random_deaths(rng, rng.integers(0, 9), ties)
+        pd1, pd2 = diagram(deaths1), diagram(deaths2)
+        assert bottleneck_dimension_0(pd1, pd2) == pytest.approx(brute_force_bottleneck(pd1, pd2), abs=1e-12)
+        for p in (1, 2):
+            assert wasserstein_dimension_0(pd1, pd2, p=p) == pytest.approx(brute_force_wasserstein(pd1, pd2, p),
+                                                                           abs=1e-12)
+
+
+def test_dimension_0_against_gudhi():
+    rng = np.random.default_rng(1)
+    for size1, size2 in [(1, 0), (50, 50), (299, 299), (200, 120)]:
+        pd1 = diagram(rng.lognormal(0.7, 0.25, size1))
+        pd2 = diagram(rng.lognormal(0.7, 0.25, size2))
+        assert bottleneck_exact(pd1, pd2) == pytest.approx(gudhi.bottleneck_distance(pd1, pd2), rel=1e-12)
+        assert wasserstein_dimension_0(pd1, pd2) == pytest.approx(
+            gudhi.hera.wasserstein_distance(pd1, pd2, order=1, internal_p=np.inf, delta=1e-6), rel=1e-5)
+
+
+def test_dimension_0_infinite_bars():
+    pd1 = np.array([[0, 1], [0, np.inf]])
+    pd2 = np.array([[0, 2], [0, np.inf]])
+    assert bottleneck_exact(pd1, pd2) == gudhi.bottleneck_distance(pd1, pd2) == 1.0
+    assert bottleneck_tiered(pd1, pd2, tolerance=0.1) == (1.0, 0.0)
+    assert wasserstein_dimension_0(pd1, pd2) == 1.0
+    assert bottleneck_exact(pd1, pd2[:1]) == wasserstein_dimension_0(pd1, pd2[:1]) == np.inf
+
+
+@pytest.mark.parametrize('tolerance', [0.0, 0.05, 0.2, 1.0])
+def test_bottleneck_tiered_error_bound(tolerance):
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        pd1, pd2 = random_diagram(rng, rng.integers(0, 9)), random_diagram(rng, rng.integers(0, 9))
+        value, error = bottleneck_tiered(pd1, pd2, tolerance=tolerance)
+        assert error <= tolerance
+        assert abs(value - brute_force_bottleneck(pd1, pd2)) <= error + 1e-9
+
+
+@pytest.mark.parametrize('min_persistence, top_k', [(0.2, None), (0.5, None), (0.0, 3), (0.2, 2)])
+def test_pruning_error_bound(min_persistence, top_k):
+    """The distance between the pruned diagrams is within its error bound plus the pruning bound of the distance between
+    the unpruned ones (brute force, or persim for sliced Wasserstein, whose value depends on the directions)."""
+    rng = np.random.default_rng(3)
+    for _ in range(100):
+        pd1, pd2 = random_diagram(rng, rng.integers(0, 9)), random_diagram(rng, rng.integers(0, 9))
+        (pruned1, dropped1), (pruned2, dropped2) = (prune_diagram(pd1, min_persistence, top_k),
+                                                    prune_diagram(pd2, min_persistence, top_k))
+        for distance, p in [('bottleneck', 1), ('bottleneck_tiered', 1), ('wasserstein', 1), ('wasserstein', 2),
+                            ('sliced_wasserstein', 1)]:
+            parameters = distance_parameters('euclidean', 1, distance, bottleneck_tolerance=0.1, wasserstein_p=p)
+            value, error = compare_pds_with_error(pruned1, pruned2, distance, **parameters)
+            error += pruning_error(distance, dropped1, dropped2, **parameters)
+            if distance.startswith('bottleneck'):
+                reference = brute_force_bottleneck(pd1, pd2)
+            elif distance == 'wasserstein':
+                reference = brute_force_wasserstein(pd1, pd2, p)
+            else:
+                reference = compare_pds_with_error(pd1, pd2, distance, **parameters)[0]
+            assert abs(value - reference) <= error + 1e-9, distance
@@ -1,5 +1,8 @@
+import functools
+import importlib.util
 import json
 import pickle
+from pathlib import Path
 import ete3
 
 import numpy as np
@@ -7,22 +10,24 @@ import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 
+# the bars are loaded by the shared barcode store of the stage B
+BARCODE_STORE_MODULE = (Path(__file__).resolve().parents[2] / 'B-from_persistence_diagrams_to_language_distances'
+                        / 'barcode_store.py')
+
+
+@functools.lru_cache(maxsize=None)
+def barcode_store_module():
+    spec = importlib.util.spec_from_file_location('barcode_store', BARCODE_STORE_MODULE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-def load_bars(filename):
-    bars = []
-    bars_dim = []
-    with open(filename, 'r') as file:
-        for row in file:
-            row = row.strip()
-            if len(row) == 0:
-                bars.append(np.array(bars_dim))
-            elif len(row) == 1:
-                bars_dim = []
-            else:
-                bars_dim.append(tuple(map(float, row.split())))
-        bars.append(np.array(bars_dim))
 
-    return bars
+def load_bars(language, n, metric, maxdim, bars_folder='data/bars', store_folder=None):
+    """Load the bars of the language as a list of float64 arrays of shape (#bars, 2), one per dimension,
+    with load_bars of the barcode store of the stage B (BARCODE_STORE_MODULE)."""
+    return barcode_store_module().load_bars(language, n, metric, maxdim, bars_folder=bars_folder,
+                                            store_folder=store_folder)
 
 
 def load_strictly_lower_triangular_matrix(filename, restrict_labels=None):